@@ -1,12 +1,12 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from database import Database
+from container import container
+from text_normalizer import normalize
 from functools import wraps
 import os
-import sqlite3
 import json
 
 admin = Blueprint('admin', __name__)
-db = Database()
+db = container.db
 
 def admin_required(f):
     @wraps(f)
@@ -64,7 +64,8 @@ def new_template():
 @admin_required
 def manage_responses():
     if request.method == 'POST':
-        trigger = request.form['trigger']
+        # Stored under the same normalised key that incoming messages are looked up by
+        trigger = normalize(request.form['trigger'])
         response_type = request.form['response_type']
         if response_type == 'text':
             response_data = {
@@ -84,7 +85,7 @@ def manage_responses():
         flash('تم حفظ الرد بنجاح', 'success')
         return redirect(url_for('admin.manage_responses'))
     responses = []
-    with sqlite3.connect(db.db_path) as conn:
+    with db.get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT trigger, response FROM responses')
         for row in cursor.fetchall():
@@ -100,7 +101,7 @@ def manage_responses():
 @admin.route('/admin/response/<trigger>/delete')
 @admin_required
 def delete_response(trigger):
-    with sqlite3.connect(db.db_path) as conn:
+    with db.get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('DELETE FROM responses WHERE trigger = ?', (trigger,))
         conn.commit()
@@ -110,7 +111,7 @@ def delete_response(trigger):
 @admin.route('/admin/response/<trigger>/edit', methods=['GET', 'POST'])
 @admin_required
 def edit_response(trigger):
-    with sqlite3.connect(db.db_path) as conn:
+    with db.get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT response FROM responses WHERE trigger = ?', (trigger,))
         row = cursor.fetchone()
@@ -1,17 +1,62 @@
+import asyncio
+import hashlib
+import json
 import openai
 import os
 from dotenv import load_dotenv
 from logger import logger
 from database import Database
+from text_normalizer import normalize
+from completion_cache import CompletionCache
+from singleflight import SingleFlight
+from history_buffer import HistoryBuffer
+from prompt_builder import PromptBuilder
 
 load_dotenv()
 
+def saved_message(saved_response):
+    """Map a saved response to a Messenger message payload, or None if it has nothing to send"""
+    data = saved_response['text']
+    if isinstance(data, str):
+        # Learned responses are stored as the JSON of {'text', 'confidence', 'learned'}
+        try:
+            decoded = json.loads(data)
+        except ValueError:
+            decoded = None
+        if not isinstance(decoded, dict):
+            return {"text": data} if data else None
+        data = decoded
+    if not isinstance(data, dict):
+        return None
+    if data.get('type') == 'media':
+        if not data.get('media_url'):
+            return None
+        return {
+            "attachment": {
+                "type": data.get('media_type') or 'file',
+                "payload": {"url": data['media_url']}
+            }
+        }
+    text = data.get('content') if data.get('type') == 'text' else data.get('text')
+    return {"text": text} if isinstance(text, str) and text else None
+
 class AIEngine:
-    def __init__(self):
+    def __init__(self, db=None, completion_backend=None, history=None):
         self.api_key = os.getenv('OPENAI_API_KEY')
         self.model = os.getenv('MODEL_NAME', 'gpt-3.5-turbo')
         self.max_history = int(os.getenv('MAX_HISTORY_MESSAGES', 10))
-        self.db = Database()
+        self.db = db or Database()
+        self.history = history or HistoryBuffer(self.db, size=self.max_history)
+        self.prompt_builder = PromptBuilder()
+        # Cached completions are only reused while the prompt and model stay the same
+        self.prompt_version = os.getenv('PROMPT_VERSION') or hashlib.sha256(
+            self.get_conversation_prompt().encode('utf-8')
+        ).hexdigest()[:12]
+        self.completion_cache = CompletionCache(db=self.db)
+        # Any coroutine function taking the ChatCompletion.acreate keyword arguments
+        self.completion_backend = completion_backend or openai.ChatCompletion.acreate
+        # Identical questions asked at the same time share one upstream call
+        self.in_flight = SingleFlight()
         openai.api_key = self.api_key
 
     def get_conversation_prompt(self):
@@ -23,56 +68,42 @@ class AIEngine:
 4. طلب توضيح إذا كان السؤال غير واضح
 5. الاعتذار بلطف إذا لم تتمكن من المساعدة"""
 
-    def prepare_messages(self, user_id, current_message):
-        """Prepare conversation history for AI"""
-        messages = [{"role": "system", "content": self.get_conversation_prompt()}]
-        
-        # Get conversation history
-        history = self.db.get_conversation_history(user_id, limit=self.max_history)
-        for msg in history:
-            role = "assistant" if msg['is_bot'] else "user"
-            messages.append({"role": role, "content": msg['message']})
-        
-        # Add current message
-        messages.append({"role": "user", "content": current_message})
-        return messages
-
-    async def generate_response(self, user_id, message, context=None):
+    def prepare_messages(self, user_id, current_message, context=None):
+        """Prepare conversation history and context for AI within the token budget; no user_id, no history"""
+        return self.prompt_builder.build(
+            self.get_conversation_prompt(),
+            self.history.get(user_id) if user_id is not None else [],
+            current_message,
+            context
+        )
+
+    async def generate_response(self, user_id, message, context=None, session=None):
         """Generate AI response"""
         try:
-            # Check for saved responses first
-            saved_response = self.db.get_custom_response(message.lower())
+            # SQLite reads block, so they run off the shared event loop
+            saved_response, context, cache_key, cached_response = await asyncio.to_thread(
+                self.lookup, user_id, message, context, session
+            )
             if saved_response:
                 logger.info(f"Found saved response for: {message}")
                 return saved_response
 
-            # Prepare messages with context
-            messages = self.prepare_messages(user_id, message)
-            if context:
-                # Add context as system message
-                messages.insert(1, {
-                    "role": "system",
-                    "content": f"معلومات السياق: {context}"
-                })
+            if cached_response is not None:
+                await asyncio.to_thread(self.save_conversation, user_id, message, cached_response)
+                return cached_response
 
             # Get AI response
-            response = await openai.ChatCompletion.acreate(
-                model=self.model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500,
-                presence_penalty=0.6
-            )
-
-            ai_response = response.choices[0].message['content']
+            if cache_key:
+                # Only users with no history get a key, so the shared prompt is the same
+                # whichever caller leads it; it gets no user id to keep it that way
+                ai_response = await self.in_flight.do(
+                    cache_key, lambda: self.complete_turn(None, message, context, cache_key)
+                )
+            else:
+                ai_response = await self.complete_turn(user_id, message, context)
             
             # Save the conversation
-            self.db.save_conversation(
-                user_id=user_id,
-                message=message,
-                response=ai_response,
-                is_saved_response=False
-            )
+            await asyncio.to_thread(self.save_conversation, user_id, message, ai_response)
 
             return ai_response
 
@@ -80,12 +111,70 @@ class AIEngine:
             logger.error(f"Error generating AI response: {str(e)}")
             return "عذراً، حدث خطأ. هل يمكنك إعادة صياغة سؤالك بطريقة أخرى؟"
 
+    def lookup(self, user_id, message, context=None, session=None):
+        """Get (saved response, context, cache key, cached completion) for a turn"""
+        # Check for saved responses first
+        saved_response = self.db.get_custom_response(normalize(message))
+        saved_response = saved_message(saved_response) if saved_response else None
+        if saved_response:
+            return saved_response, context, None, None
+
+        if context is None and session is not None:
+            context = session.context
+
+        # Reuse a completion for the same standalone question
+        history = self.history.get(user_id) if self.completion_cache.enabled else None
+        cache_key = self.completion_cache.make_key(message, context, self.model, self.prompt_version, history)
+        cached_response = self.completion_cache.get(cache_key) if cache_key else None
+        return None, context, cache_key, cached_response
+
+    def save_conversation(self, user_id, message, response):
+        """Save a bot turn and add it to the user's in-memory history"""
+        self.db.save_conversation(
+            user_id=user_id,
+            message=message,
+            response=response,
+            is_bot=True
+        )
+        self.history.append(user_id, message, response, is_bot=True)
+
+    async def complete_turn(self, user_id, message, context=None, cache_key=None):
+        """Build the prompt in a thread, since history may come from the database, then complete it"""
+        messages = await asyncio.to_thread(self.prepare_messages, user_id, message, context)
+        return await self.complete(messages, cache_key)
+
+    async def complete(self, messages, cache_key=None):
+        """Ask the completion backend for a reply and cache it under cache_key"""
+        response = await self.completion_backend(
+            model=self.model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=500,
+            presence_penalty=0.6
+        )
+
+        ai_response = response.choices[0].message['content']
+        if cache_key:
+            await asyncio.to_thread(self.completion_cache.put, cache_key, ai_response)
+        return ai_response
+
+    def get_stats(self):
+        """Get model, prompt version, cache, coalescing, history and prompt size statistics"""
+        return {
+            'model': self.model,
+            'prompt_version': self.prompt_version,
+            'completion_cache': self.completion_cache.get_stats(),
+            'coalescing': self.in_flight.get_stats(),
+            'history': self.history.get_stats(),
+            'prompt': self.prompt_builder.get_stats()
+        }
+
     def learn_from_conversation(self, message, response, confidence_score=None):
         """Learn from successful conversations"""
         try:
             if confidence_score and confidence_score > 0.8:  # Only learn from high-confidence interactions
                 # Clean and normalize the message
-                cleaned_message = message.lower().strip()
+                cleaned_message = normalize(message)
                 
                 # Save as a custom response if it's not already saved
                 if not self.db.get_custom_response(cleaned_message):
@@ -98,6 +187,3 @@ class AIEngine:
 
         except Exception as e:
             logger.error(f"Error learning from conversation: {str(e)}")
-
-# Create global AI engine instance
-ai_engine = AIEngine()
@@ -1,75 +1,138 @@
-import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict
+import atexit
 import json
+import os
+import threading
 from logger import logger
+from database import Database
 
 class Analytics:
-    def __init__(self, db_path='facebook_bot.db'):
-        self.db_path = db_path
-        self._init_db()
+    def __init__(self, db_path='facebook_bot.db', buffered=None, batch_size=None,
+                 flush_interval=None, max_buffer=None, db=None):
+        # The interactions and metrics tables are created by Database
+        self.db = db or Database(db_path)
+        self.db_path = self.db.db_path
+        
+        # Write-behind buffer: interactions and metric increments are
+        # accumulated in memory and written in one transaction
+        if buffered is None:
+            buffered = os.getenv('ANALYTICS_BUFFERED', 'true').lower() == 'true'
+        self.buffered = buffered
+        self.batch_size = batch_size or int(os.getenv('ANALYTICS_BATCH_SIZE', 200))
+        self.flush_interval = flush_interval or float(os.getenv('ANALYTICS_FLUSH_INTERVAL', 2.0))
+        self.max_buffer = max_buffer or int(os.getenv('ANALYTICS_MAX_BUFFER', 10000))
+        self.buffer_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending_interactions = []
+        self.pending_metrics = defaultdict(int)
+        self.flush_requested = threading.Event()
+        self.closed = threading.Event()
+        self.flushed = 0
+        self.flushes = 0
+        self.dropped = 0
+        self.flusher = None
+        if self.buffered:
+            self.flusher = threading.Thread(target=self._flush_loop, name='analytics-flusher', daemon=True)
+            self.flusher.start()
+            atexit.register(self.close)
     
-    def _init_db(self):
-        """Initialize analytics tables"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Create interactions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS interactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT,
-                    interaction_type TEXT,
-                    content TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Create metrics table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS metrics (
-                    date DATE,
-                    metric_name TEXT,
-                    value INTEGER,
-                    PRIMARY KEY (date, metric_name)
-                )
-            ''')
-            
-            conn.commit()
+    def get_connection(self):
+        """Get a pooled connection as a transaction context manager"""
+        return self.db.get_connection()
     
     def log_interaction(self, user_id, interaction_type, content):
         """Log a user interaction"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    'INSERT INTO interactions (user_id, interaction_type, content) VALUES (?, ?, ?)',
-                    (user_id, interaction_type, json.dumps(content))
-                )
-                conn.commit()
-        except Exception as e:
-            logger.error(f"Error logging interaction: {str(e)}")
+        # Match the format of CURRENT_TIMESTAMP so buffered rows sort with old ones
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        row = (user_id, interaction_type, json.dumps(content), timestamp)
+        with self.buffer_lock:
+            if len(self.pending_interactions) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self.pending_interactions.append(row)
+            full = len(self.pending_interactions) >= self.batch_size
+        self._after_write(full)
     
     def update_daily_metric(self, metric_name, increment=1):
         """Update daily metric counter"""
         today = datetime.now().date()
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO metrics (date, metric_name, value)
-                    VALUES (?, ?, ?)
-                    ON CONFLICT(date, metric_name) DO UPDATE SET
-                    value = value + ?
-                ''', (today, metric_name, increment, increment))
-                conn.commit()
-        except Exception as e:
-            logger.error(f"Error updating metric: {str(e)}")
+        with self.buffer_lock:
+            self.pending_metrics[(today, metric_name)] += increment
+        self._after_write(False)
+    
+    def _after_write(self, full):
+        """Flush now when unbuffered, or wake the flusher when a batch is full"""
+        if not self.buffered:
+            self.flush()
+        elif full:
+            self.flush_requested.set()
+    
+    def _flush_loop(self):
+        """Flush the buffer on an interval or when a batch fills up"""
+        while not self.closed.is_set():
+            self.flush_requested.wait(self.flush_interval)
+            self.flush_requested.clear()
+            self.flush()
+    
+    def flush(self):
+        """Write buffered interactions and metric increments in one transaction"""
+        with self.flush_lock:
+            with self.buffer_lock:
+                interactions, self.pending_interactions = self.pending_interactions, []
+                metrics, self.pending_metrics = self.pending_metrics, defaultdict(int)
+            if not interactions and not metrics:
+                return 0
+            
+            try:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.executemany(
+                        'INSERT INTO interactions (user_id, interaction_type, content, timestamp) VALUES (?, ?, ?, ?)',
+                        interactions
+                    )
+                    cursor.executemany('''
+                        INSERT INTO metrics (date, metric_name, value)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT(date, metric_name) DO UPDATE SET
+                        value = value + ?
+                    ''', [(date, name, increment, increment) for (date, name), increment in metrics.items()])
+                    conn.commit()
+            except Exception as e:
+                logger.error(f"Error flushing analytics: {str(e)}")
+                self.dropped += len(interactions)
+                return 0
+            
+            self.flushed += len(interactions)
+            self.flushes += 1
+            return len(interactions)
+    
+    def close(self):
+        """Stop the background flusher and write whatever is left"""
+        self.closed.set()
+        self.flush_requested.set()
+        if self.flusher and self.flusher is not threading.current_thread():
+            self.flusher.join(5)
+        self.flush()
+    
+    def get_stats(self):
+        """Get write-behind buffer statistics"""
+        with self.buffer_lock:
+            return {
+                'buffered': self.buffered,
+                'pending_interactions': len(self.pending_interactions),
+                'pending_metrics': len(self.pending_metrics),
+                'flushed': self.flushed,
+                'flushes': self.flushes,
+                'dropped': self.dropped
+            }
     
     def get_user_stats(self, days=7):
         """Get user interaction statistics"""
+        self.flush()
         start_date = datetime.now() - timedelta(days=days)
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT 
@@ -92,8 +155,9 @@ class Analytics:
     
     def get_popular_interactions(self, limit=10):
         """Get most common interaction types"""
+        self.flush()
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT 
@@ -111,9 +175,10 @@ class Analytics:
     
     def generate_daily_report(self):
         """Generate daily analytics report"""
+        self.flush()
         try:
             today = datetime.now().date()
-            with sqlite3.connect(self.db_path) as conn:
+            with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
                 # Get today's metrics
@@ -143,6 +208,3 @@ class Analytics:
         except Exception as e:
             logger.error(f"Error generating daily report: {str(e)}")
             return None
-
-# Create global analytics instance
-analytics = Analytics()
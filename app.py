@@ -1,16 +1,17 @@
 from flask import Flask, request, jsonify, render_template
+import asyncio
 import os
-import requests
+import atexit
 from dotenv import load_dotenv
-from database import Database
 from message_handler import MessageHandler
 from admin import admin
-from logger import Logger
-from session_manager import SessionManager
-from menu_manager import MenuManager
-from analytics import Analytics
-from ai_engine import AIEngine
-from conversation_learner import ConversationLearner
+from logger import logger
+from container import container
+from work_queue import WorkQueue
+from async_runner import async_runner
+from graph_client import graph_client
+from outbound import OutboundDispatcher
+from dedup import EventDeduplicator, event_key
 
 # Load environment variables
 load_dotenv()
@@ -19,20 +20,27 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-12345")
 app.register_blueprint(admin)
 
-# Initialize components
-db = Database()
-session_manager = SessionManager()
-logger = Logger()
-menu_manager = MenuManager()
-analytics = Analytics()
-ai_engine = AIEngine()
-conversation_learner = ConversationLearner()
-message_handler = None  # Will be initialized after send_message function is defined
+# Shared components, each built once by the container
+db = container.db
+session_manager = container.session_manager
+menu_manager = container.menu_manager
+analytics = container.analytics
+ai_engine = container.ai_engine
+conversation_learner = container.conversation_learner
+event_deduplicator = EventDeduplicator()
 
 # Facebook Configuration
 PAGE_ACCESS_TOKEN = os.getenv('PAGE_ACCESS_TOKEN')
 VERIFY_TOKEN = os.getenv('VERIFY_TOKEN')
 
+# Webhook processing mode: when enabled, the webhook returns without waiting for queued events
+WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', 'false').lower() == 'true'
+AI_RESPONSE_TIMEOUT = float(os.getenv('AI_RESPONSE_TIMEOUT', 60))
+# Seconds the webhook waits for room in a full lane before asking Facebook to redeliver
+WEBHOOK_ENQUEUE_TIMEOUT = float(os.getenv('WEBHOOK_ENQUEUE_TIMEOUT', 0.05 if WEBHOOK_ASYNC else 5))
+# Outbound mode: when enabled, sends go through the ordered, rate-limited dispatcher
+OUTBOUND_QUEUE = os.getenv('OUTBOUND_QUEUE', 'false').lower() == 'true'
+
 # Home page route
 @app.route('/')
 def home():
@@ -40,47 +48,56 @@ def home():
 
 def send_message(recipient_id, response):
     """Send message to user using Facebook Graph API"""
-    endpoint = f"https://graph.facebook.com/v17.0/me/messages"
-    params = {"access_token": PAGE_ACCESS_TOKEN}
-    headers = {"Content-Type": "application/json"}
-    
-    response_data = {
-        "recipient": {"id": recipient_id},
-        "message": response
-    }
-    
-    requests.post(endpoint, json=response_data, params=params, headers=headers)
+    if OUTBOUND_QUEUE:
+        outbound_dispatcher.enqueue(recipient_id, response)
+        return
+    try:
+        graph_client.send(recipient_id, response)
+    except Exception as e:
+        logger.error(f"Error sending message to {recipient_id}: {str(e)}")
+
+async def send_message_async(recipient_id, response):
+    """Send message to user from the event loop without blocking it"""
+    if OUTBOUND_QUEUE:
+        outbound_dispatcher.enqueue(recipient_id, response)
+        return
+    try:
+        await graph_client.send_async(recipient_id, response)
+    except Exception as e:
+        logger.error(f"Error sending message to {recipient_id}: {str(e)}")
+
+message_handler = MessageHandler(send_message)
 
 async def handle_text_message(sender_id, message_text):
     """Handle incoming text messages"""
+    # Every conversation shares one event loop, so blocking lookups and writes run in threads
     try:
         # First, check for learned responses
-        learned_response = conversation_learner.get_learned_response(message_text)
+        learned_response = await asyncio.to_thread(conversation_learner.get_learned_response, message_text)
         if learned_response and learned_response['confidence'] > 0.8:
             response_data = {"text": learned_response['text']}
-            send_message(sender_id, response_data)
-            analytics.log_interaction(sender_id, 'learned_response', message_text)
+            await send_message_async(sender_id, response_data)
+            await asyncio.to_thread(analytics.log_interaction, sender_id, 'learned_response', message_text)
             return
 
-        # Get session context
-        session = session_manager.get_session(sender_id)
-        context = session.context if session else None
+        # The AI call uses the session's context
+        session = await asyncio.to_thread(session_manager.get_session, sender_id)
 
         # Generate AI response
-        ai_response = await ai_engine.generate_response(sender_id, message_text, context)
+        ai_response = await ai_engine.generate_response(sender_id, message_text, session=session)
         
         if isinstance(ai_response, str):
             response_data = {"text": ai_response}
         else:
             response_data = ai_response
 
-        send_message(sender_id, response_data)
-        analytics.log_interaction(sender_id, 'ai_response', message_text)
+        await send_message_async(sender_id, response_data)
+        await asyncio.to_thread(analytics.log_interaction, sender_id, 'ai_response', message_text)
 
     except Exception as e:
         logger.error(f"Error handling message: {str(e)}")
         error_message = {"text": "عذراً، حدث خطأ. الرجاء المحاولة مرة أخرى."}
-        send_message(sender_id, error_message)
+        await send_message_async(sender_id, error_message)
 
 def send_template_message(recipient_id, template_data):
     """Send a template message"""
@@ -138,49 +155,131 @@ def verify_webhook():
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Handle incoming messages from Facebook"""
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    pending = []
     
-    if data['object'] == 'page':
-        for entry in data['entry']:
-            for messaging_event in entry['messaging']:
-                sender_id = messaging_event['sender']['id']
+    if data and data.get('object') == 'page':
+        for entry in data.get('entry', []):
+            for messaging_event in entry.get('messaging', []):
+                if not messaging_event.get('sender', {}).get('id'):
+                    logger.warning("Skipping messaging event without sender")
+                    continue
                 
-                # Get or create session for user
-                session = session_manager.get_session(sender_id)
-                
-                try:
-                    # Handle text messages
-                    if 'message' in messaging_event:
-                        if 'text' in messaging_event['message']:
-                            message_text = messaging_event['message']['text']
-                            analytics.log_interaction(sender_id, 'text_message', message_text)
-                            import asyncio
-                            asyncio.run(handle_text_message(sender_id, message_text))
-                        
-                        # Handle quick replies
-                        if 'quick_reply' in messaging_event['message']:
-                            payload = messaging_event['message']['quick_reply']['payload']
-                            analytics.log_interaction(sender_id, 'quick_reply', payload)
-                            response = menu_manager.handle_payload(payload, session)
-                            send_message(sender_id, response)
-                    
-                    # Handle postback buttons
-                    if 'postback' in messaging_event:
-                        payload = messaging_event['postback']['payload']
-                        analytics.log_interaction(sender_id, 'postback', payload)
-                        response = menu_manager.handle_payload(payload, session)
-                        send_message(sender_id, response)
+                # Drop Facebook redeliveries before doing any work
+                key = event_key(messaging_event)
+                if event_deduplicator.is_duplicate(key):
+                    continue
                 
-                except Exception as e:
-                    logger.error(f"Error handling message: {str(e)}")
-                    error_message = {"text": "عذراً، حدث خطأ. الرجاء المحاولة مرة أخرى."}
-                    send_message(sender_id, error_message)
-                
-                # Update analytics
-                analytics.update_daily_metric('total_messages')
+                # Events from one sender share a lane so they stay in order
+                sender_id = messaging_event['sender']['id']
+                future = webhook_queue.submit(
+                    messaging_event, key=sender_id, block=True, timeout=WEBHOOK_ENQUEUE_TIMEOUT
+                )
+                if future is None:
+                    # Processing it here would overtake the sender's queued events, so shed
+                    # it and the rest of the batch; the redelivery skips what was queued
+                    logger.warning("Webhook lane is full, asking Facebook to redeliver")
+                    event_deduplicator.release(key)
+                    wait_for_pending(pending)
+                    return 'Busy', 503
+                if not WEBHOOK_ASYNC:
+                    pending.append(future)
+        
+        # Different senders are processed in parallel lanes
+        wait_for_pending(pending)
                     
     return 'OK', 200
 
+def process_messaging_event(messaging_event):
+    """Process a single messaging event, returning a Future for pending AI work"""
+    sender_id = messaging_event['sender']['id']
+    pending = None
+    
+    # Get or create session for user
+    session = session_manager.get_session(sender_id)
+    
+    try:
+        # Handle text messages
+        if 'message' in messaging_event:
+            if 'text' in messaging_event['message']:
+                message_text = messaging_event['message']['text']
+                analytics.log_interaction(sender_id, 'text_message', message_text)
+                pending = async_runner.submit(handle_text_message(sender_id, message_text))
+            
+            # Handle quick replies
+            if 'quick_reply' in messaging_event['message']:
+                payload = messaging_event['message']['quick_reply']['payload']
+                analytics.log_interaction(sender_id, 'quick_reply', payload)
+                response = menu_manager.handle_payload(payload, session)
+                send_message(sender_id, response)
+        
+        # Handle postback buttons
+        if 'postback' in messaging_event:
+            payload = messaging_event['postback']['payload']
+            analytics.log_interaction(sender_id, 'postback', payload)
+            response = menu_manager.handle_payload(payload, session)
+            send_message(sender_id, response)
+    
+    except Exception as e:
+        logger.error(f"Error handling message: {str(e)}")
+        error_message = {"text": "عذراً، حدث خطأ. الرجاء المحاولة مرة أخرى."}
+        send_message(sender_id, error_message)
+    
+    # Update analytics
+    analytics.update_daily_metric('total_messages')
+    return pending
+
+def wait_for_pending(futures):
+    """Wait for AI handling submitted to the event loop"""
+    for future in futures:
+        if future is None:
+            continue
+        try:
+            future.result(timeout=AI_RESPONSE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error waiting for AI response: {str(e)}")
+
+def close_graph_client():
+    """Close pooled Graph API connections"""
+    if async_runner.get_stats()['running']:
+        async_runner.run(graph_client.aclose(), timeout=5)
+    graph_client.close()
+
+def handle_messaging_event(messaging_event):
+    """Process a messaging event and wait for its AI handling to finish"""
+    wait_for_pending([process_messaging_event(messaging_event)])
+
+# Shutdown hooks run in reverse order: the event loop and connection pools go last
+atexit.register(async_runner.stop)
+atexit.register(close_graph_client)
+
+# Ordered, rate-limited delivery of outgoing messages
+outbound_dispatcher = OutboundDispatcher(graph_client.send)
+if OUTBOUND_QUEUE:
+    outbound_dispatcher.start()
+    atexit.register(outbound_dispatcher.stop)
+
+# Sender-sharded lanes for webhook events
+webhook_queue = WorkQueue(handle_messaging_event)
+webhook_queue.start()
+atexit.register(webhook_queue.stop)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose runtime statistics for monitoring"""
+    return jsonify({
+        "webhook_mode": "async" if WEBHOOK_ASYNC else "sync",
+        "webhook_queue": webhook_queue.get_stats(),
+        "dedup": event_deduplicator.get_stats(),
+        "sessions": session_manager.get_stats(),
+        "learner": conversation_learner.get_stats(),
+        "ai": ai_engine.get_stats(),
+        "analytics": analytics.get_stats(),
+        "event_loop": async_runner.get_stats(),
+        "graph_api": graph_client.get_stats(),
+        "outbound": outbound_dispatcher.get_stats()
+    })
+
 def handle_postback(sender_id, payload):
     """Handle postback from buttons"""
     # Example postback handling
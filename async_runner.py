@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from logger import logger
+
+class AsyncRunner:
+    """Runs coroutines on one long-lived event loop in a background thread"""
+
+    def __init__(self, name='async-runner'):
+        self.name = name
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.submitted = 0
+
+    def start(self):
+        """Start the event loop thread if it is not already running"""
+        with self.lock:
+            if self.loop and self.loop.is_running():
+                return self.loop
+            ready = threading.Event()
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(
+                target=self._run_loop,
+                args=(self.loop, ready),
+                name=self.name,
+                daemon=True
+            )
+            self.thread.start()
+            ready.wait()
+            logger.info("Started background event loop")
+            return self.loop
+
+    def _run_loop(self, loop, ready):
+        """Run the event loop forever in the current thread"""
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop and return a concurrent Future"""
+        loop = self.start()
+        with self.lock:
+            self.submitted += 1
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and wait for its result"""
+        return self.submit(coro).result(timeout)
+
+    def stop(self, timeout=5):
+        """Cancel pending tasks and stop the event loop"""
+        with self.lock:
+            loop, thread = self.loop, self.thread
+            self.loop = None
+            self.thread = None
+        if not loop:
+            return
+
+        async def _shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(_shutdown(), loop).result(timeout)
+        except Exception as e:
+            logger.error(f"Error shutting down event loop: {str(e)}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        loop.close()
+
+    def get_stats(self):
+        """Get event loop statistics"""
+        loop = self.loop
+        pending = 0
+        if loop and loop.is_running():
+            pending = len(asyncio.all_tasks(loop))
+        return {
+            'running': bool(loop and loop.is_running()),
+            'pending_tasks': pending,
+            'submitted': self.submitted
+        }
+
+# Create global async runner instance
+async_runner = AsyncRunner()
@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the bot's hot paths
+
+Usage:
+    python benchmark.py inserts [--count N]
+    python benchmark.py startup [--runs N] [--users N]
+    python benchmark.py memory [--sessions N]
+    python benchmark.py navigation [--count N] [--users N]
+    python benchmark.py learner [--sizes N,N,...] [--queries N]
+    python benchmark.py matchers [--size N] [--queries N] [--configs PERM:BANDS,...]
+    python benchmark.py tfidf [--size N] [--queries N] [--batch N]
+    python benchmark.py normalize [--count N] [--distinct N]
+    python benchmark.py coldstart [--sizes N,N,...] [--matcher NAME]
+    python benchmark.py responses [--events N] [--patterns N] [--cap N]
+"""
+import argparse
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+
+from database import Database
+
+def _report(label, count, elapsed):
+    print(f"{label:<40} {count:>9} ops  {elapsed:8.3f}s  {count / elapsed:12.1f} ops/s")
+
+def bench_inserts(args):
+    """Conversation inserts: connect-per-call vs pooled WAL connection"""
+    with tempfile.TemporaryDirectory() as tmp:
+        # Before: a fresh connection and rollback-journal commit per insert
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        with sqlite3.connect(legacy_path) as conn:
+            conn.execute('''
+                CREATE TABLE conversation_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT,
+                    message TEXT,
+                    response TEXT,
+                    is_bot BOOLEAN,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    feedback INTEGER DEFAULT 0
+                )
+            ''')
+        started = time.perf_counter()
+        for i in range(args.count):
+            with sqlite3.connect(legacy_path) as conn:
+                conn.execute(
+                    'INSERT INTO conversation_history (user_id, message, response, is_bot) VALUES (?, ?, ?, ?)',
+                    (f"user-{i % 100}", 'message', 'response', True)
+                )
+                conn.commit()
+        _report('connect per insert (rollback journal)', args.count, time.perf_counter() - started)
+
+        # After: the pooled thread-local connection with WAL and synchronous=NORMAL
+        db = Database(os.path.join(tmp, 'pooled.db'))
+        started = time.perf_counter()
+        for i in range(args.count):
+            db.save_conversation(f"user-{i % 100}", 'message', 'response', is_bot=True)
+        _report('pooled connection (WAL, NORMAL)', args.count, time.perf_counter() - started)
+        db.pool.close_all()
+
+def bench_startup(args):
+    """App import time and per-new-user session cost"""
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, SESSION_SECRET='benchmark')
+    script = (
+        "import time, database\n"
+        "calls = [0]\n"
+        "init_db = database.Database._init_db\n"
+        "def counted(self):\n"
+        "    calls[0] += 1\n"
+        "    return init_db(self)\n"
+        "database.Database._init_db = counted\n"
+        "started = time.perf_counter()\n"
+        "import app\n"
+        "print(time.perf_counter() - started, calls[0])\n"
+    )
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, '-c', script], cwd=tmp, env=env,
+                capture_output=True, text=True, check=True
+            ).stdout
+            elapsed, schema_inits = output.strip().splitlines()[-1].split()
+            timings.append(float(elapsed))
+    print(f"{'import app (fresh process)':<40} {args.runs:>9} runs {min(timings):8.3f}s min  {sum(timings) / len(timings):8.3f}s avg")
+    print(f"{'schema initialisations at startup':<40} {schema_inits:>9}")
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            from session_manager import SessionManager
+            session_manager = SessionManager()
+            started = time.perf_counter()
+            for i in range(args.users):
+                session_manager.get_session(f"new-user-{i}")
+            elapsed = time.perf_counter() - started
+        finally:
+            os.chdir(cwd)
+    print(f"{'new user session':<40} {args.users:>9} ops  {elapsed:8.3f}s  {elapsed / args.users * 1e6:10.1f} us/user")
+
+class LegacySession:
+    """Session layout before slots: instance dict, own Database, datetime and eager context"""
+    def __init__(self, user_id, db_path):
+        self.user_id = user_id
+        self.current_state = 'START'
+        self.context = {}
+        self.last_interaction = datetime.now()
+        self.db = Database(db_path)
+
+def _bytes_per_session(build, count):
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    sessions = {f"user-{i}": build(f"user-{i}") for i in range(count)}
+    allocated = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del sessions
+    return allocated / count
+
+def bench_memory(args):
+    """Resident bytes per active session"""
+    from session_manager import ConversationSession
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bot.db')
+        db = Database(db_path)
+
+        before = _bytes_per_session(lambda user_id: LegacySession(user_id, db_path), args.sessions)
+        print(f"{'dict session + Database + datetime':<40} {args.sessions:>9} sessions {before:10.1f} bytes/session")
+
+        def build(user_id):
+            session = ConversationSession(user_id, db)
+            session.current_state = 'START'
+            session.last_interaction = int(time.time())
+            return session
+        after = _bytes_per_session(build, args.sessions)
+        print(f"{'slotted session, shared db, epoch int':<40} {args.sessions:>9} sessions {after:10.1f} bytes/session")
+        db.pool.close_all()
+
+def bench_navigation(args):
+    """Menu state changes under immediate vs batched session durability"""
+    from session_manager import SessionManager
+    states = ['MAIN', 'SERVICES', 'PRODUCTS', 'CONTACT']
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('immediate', 'batched'):
+            db = Database(os.path.join(tmp, f"{mode}.db"))
+            session_manager = SessionManager(db=db, durability=mode)
+            sessions = [session_manager.get_session(f"user-{i}") for i in range(args.users)]
+            started = time.perf_counter()
+            for i in range(args.count):
+                sessions[i % args.users].update_session(new_state=states[(i // args.users) % len(states)])
+            elapsed = time.perf_counter() - started
+            session_manager.close()
+            _report(f"update_session ({mode})", args.count, elapsed)
+            db.pool.close_all()
+
+def _learned_corpus(size, rng):
+    """Synthetic learned messages with a Zipf-like word distribution"""
+    vocabulary = [f"word{i}" for i in range(5000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    messages = {}
+    while len(messages) < size:
+        words = rng.choices(vocabulary, weights, k=rng.randint(2, 10))
+        messages[' '.join(words)] = None
+    return list(messages), vocabulary, weights
+
+def _linear_best_match(messages, query, threshold):
+    """ConversationLearner.find_similar_message before the index"""
+    best_match = None
+    best_score = 0
+    words1 = set(query.split())
+    for learned in messages:
+        words2 = set(learned.split())
+        if not words1 or not words2:
+            score = 0
+        else:
+            score = len(words1.intersection(words2)) / len(words1.union(words2))
+        if score > threshold and score > best_score:
+            best_match = learned
+            best_score = score
+    return best_match, best_score
+
+def bench_learner(args):
+    """Learned-response lookup: linear Jaccard scan vs inverted token index"""
+    from token_index import TokenIndex
+    rng = random.Random(42)
+    for size in [int(size) for size in args.sizes.split(',')]:
+        messages, vocabulary, weights = _learned_corpus(size, rng)
+        queries = []
+        for i in range(args.queries):
+            if i % 2:
+                queries.append(' '.join(rng.choices(vocabulary, weights, k=rng.randint(2, 10))))
+            else:
+                # A learned message with one word swapped
+                words = rng.choice(messages).split()
+                words[rng.randrange(len(words))] = rng.choice(vocabulary)
+                queries.append(' '.join(words))
+
+        started = time.perf_counter()
+        index = TokenIndex()
+        for message in messages:
+            index.add(message)
+        print(f"{'build index':<40} {size:>9} msgs {time.perf_counter() - started:8.3f}s")
+
+        started = time.perf_counter()
+        indexed = [index.best_match(query, 0.8) for query in queries]
+        _report(f"token index @ {size}", len(queries), time.perf_counter() - started)
+
+        # The scan is slow at large sizes, so time it on fewer queries
+        scanned = queries[:max(3, min(len(queries), 2000000 // size))]
+        started = time.perf_counter()
+        linear = [_linear_best_match(messages, query, 0.8) for query in scanned]
+        _report(f"linear scan @ {size}", len(scanned), time.perf_counter() - started)
+        assert linear == indexed[:len(scanned)], 'token index disagrees with the linear scan'
+
+def _percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+def bench_matchers(args):
+    """Recall and lookup latency of MinHash/LSH configurations against the exact index"""
+    from token_index import TokenIndex
+    from minhash_index import MinHashIndex
+    rng = random.Random(42)
+    messages, vocabulary, weights = _learned_corpus(args.size, rng)
+    queries = []
+    for i in range(args.queries):
+        words = rng.choice(messages).split()
+        if i % 3 == 0:
+            words.append(rng.choice(vocabulary))
+        elif i % 3 == 1:
+            words[rng.randrange(len(words))] = rng.choice(vocabulary)
+        else:
+            words = rng.choices(vocabulary, weights, k=rng.randint(2, 10))
+        queries.append(' '.join(words))
+
+    matchers = [('exact', TokenIndex())]
+    for config in args.configs.split(','):
+        num_perm, bands = (int(value) for value in config.split(':'))
+        matchers.append((f"minhash {num_perm}x{bands}", MinHashIndex(num_perm=num_perm, bands=bands)))
+
+    expected = None
+    print(f"{'matcher':<22} {'build s':>8} {'recall':>7} {'p50 us':>9} {'p99 us':>9}")
+    for name, index in matchers:
+        started = time.perf_counter()
+        for message in messages:
+            index.add(message)
+        build = time.perf_counter() - started
+
+        results = []
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            results.append(index.best_match(query, args.threshold))
+            latencies.append((time.perf_counter() - started) * 1e6)
+        if expected is None:
+            expected = results
+        matched = [i for i, (match, score) in enumerate(expected) if match is not None]
+        recall = sum(results[i][1] == expected[i][1] for i in matched) / len(matched) if matched else 1.0
+        print(f"{name:<22} {build:8.2f} {recall:7.3f} {_percentile(latencies, 50):9.1f} {_percentile(latencies, 99):9.1f}")
+
+def bench_tfidf(args):
+    """TF-IDF scorer: single and batched lookups, and the refresh after learning"""
+    from tfidf_index import TfidfIndex
+    rng = random.Random(42)
+    messages, vocabulary, weights = _learned_corpus(args.size, rng)
+    queries = [' '.join(rng.choices(vocabulary, weights, k=rng.randint(2, 10))) for _ in range(args.queries)]
+
+    started = time.perf_counter()
+    index = TfidfIndex()
+    for message in messages:
+        index.add(message)
+    index.best_match(queries[0], 0.8)
+    print(f"{'build matrix':<40} {args.size:>9} msgs {time.perf_counter() - started:8.3f}s")
+
+    scanned = queries[:max(3, min(len(queries), 2000000 // args.size))]
+    started = time.perf_counter()
+    for query in scanned:
+        _linear_best_match(messages, query, 0.8)
+    _report('linear Jaccard scan', len(scanned), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    single = [index.best_match(query, 0.8) for query in queries]
+    _report('tfidf, one query per product', len(queries), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    batched = []
+    for start in range(0, len(queries), args.batch):
+        batched.extend(index.best_matches(queries[start:start + args.batch], 0.8))
+    _report(f"tfidf, {args.batch} queries per product", len(queries), time.perf_counter() - started)
+    assert batched == single, 'batched and single lookups disagree'
+
+    started = time.perf_counter()
+    index.add('a newly learned message')
+    index.best_match(queries[0], 0.8)
+    print(f"{'learn one message + lookup':<40} {'':>9}      {time.perf_counter() - started:8.3f}s")
+
+    # The matrix is rebuilt off the lookup path; time that rebuild on its own
+    index.add('another newly learned message')
+    started = time.perf_counter()
+    index.refresh()
+    print(f"{'background rebuild':<40} {'':>9}      {time.perf_counter() - started:8.3f}s")
+
+def _legacy_clean_message(message):
+    """ConversationLearner.clean_message before the shared normaliser"""
+    message = message.lower().strip()
+    message = re.sub(r'[^\w\s]', '', message)
+    message = re.sub(r'[\u064B-\u065F]', '', message)
+    for old, new in {'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ة': 'ه', 'ى': 'ي'}.items():
+        message = message.replace(old, new)
+    return message
+
+def bench_normalize(args):
+    """Message normalisation: regex and replace chain vs translate table and memo"""
+    from text_normalizer import normalize
+    rng = random.Random(42)
+    phrases = ['السَّلامُ عَلَيْكُم', 'أين طلبي؟', 'مرحباً، كيف الحال!', 'إلى متى الانتظار', 'شكراً جزيلاً', 'Where is my order?']
+    distinct = [f"{rng.choice(phrases)} {rng.choice(phrases)} {i}" for i in range(args.distinct)]
+    messages = [rng.choice(distinct) for _ in range(args.count)]
+
+    started = time.perf_counter()
+    for message in messages:
+        _legacy_clean_message(message)
+    _report('regex + replace chain', args.count, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for message in messages:
+        normalize.__wrapped__(message)
+    _report('precompiled + translate (no memo)', args.count, time.perf_counter() - started)
+
+    normalize.cache_clear()
+    started = time.perf_counter()
+    for message in messages:
+        normalize(message)
+    _report(f"translate + LRU memo ({args.distinct} distinct)", args.count, time.perf_counter() - started)
+
+def bench_coldstart(args):
+    """Learner cold start: full reload vs snapshot plus replay of new rows"""
+    from conversation_learner import ConversationLearner
+    rng = random.Random(42)
+    for size in [int(size) for size in args.sizes.split(',')]:
+        messages, _, _ = _learned_corpus(size, rng)
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Database(os.path.join(tmp, 'bot.db'))
+            with db.get_connection() as conn:
+                conn.executemany(
+                    'INSERT INTO conversation_history (user_id, message, response, is_bot, feedback) VALUES (?, ?, ?, 1, 1)',
+                    ((f"user-{i % 100}", message, f"response {i}") for i, message in enumerate(messages))
+                )
+
+            started = time.perf_counter()
+            ConversationLearner(db=db, matcher=args.matcher, snapshot=False)
+            full = time.perf_counter() - started
+
+            started = time.perf_counter()
+            ConversationLearner(db=db, matcher=args.matcher, snapshot=True)
+            first = time.perf_counter() - started
+            snapshot_size = os.path.getsize(f"{db.db_path}.learner")
+
+            # One percent of the corpus learned since the snapshot was written
+            with db.get_connection() as conn:
+                conn.executemany(
+                    'INSERT INTO conversation_history (user_id, message, response, is_bot, feedback) VALUES (?, ?, ?, 1, 1)',
+                    ((f"user-{i}", f"{message} new", 'response') for i, message in enumerate(messages[:size // 100]))
+                )
+            started = time.perf_counter()
+            ConversationLearner(db=db, matcher=args.matcher, snapshot=True)
+            warm = time.perf_counter() - started
+            db.pool.close_all()
+        print(f"{size:>9} rows  full reload {full:7.3f}s  first start + write {first:7.3f}s  "
+              f"snapshot + 1% replay {warm:7.3f}s  snapshot {snapshot_size / 1e6:7.1f} MB")
+
+def _traced_bytes(build):
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = build()
+    allocated = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return result, allocated
+
+def bench_responses(args):
+    """Learned-response memory: appended lists vs the deduplicated, bounded store"""
+    from collections import defaultdict
+    from response_store import ResponseStore
+    rng = random.Random(42)
+    templates = [f"Thanks for asking about topic {i}, here is what you need to know." for i in range(200)]
+    # Each feedback row read from the database is a fresh string, even when the text repeats
+    events = [(f"pattern {rng.randint(0, args.patterns - 1)}", rng.choice(templates)) for _ in range(args.events)]
+
+    def build_lists():
+        patterns = defaultdict(list)
+        for pattern, response in events:
+            patterns[pattern].append(''.join(response))
+        return patterns
+    patterns, before = _traced_bytes(build_lists)
+    print(f"{'defaultdict(list), every append':<40} {len(patterns):>9} patterns {before / 1e6:9.1f} MB")
+    del patterns
+
+    for max_patterns in (0, args.cap):
+        def build_store():
+            store = ResponseStore(max_patterns=max_patterns)
+            for pattern, response in events:
+                store.add(pattern, ''.join(response))
+            return store
+        store, after = _traced_bytes(build_store)
+        label = f"ResponseStore, cap {max_patterns or 'none'}"
+        print(f"{label:<40} {len(store):>9} patterns {after / 1e6:9.1f} MB  "
+              f"(reported {store.memory_footprint() / 1e6:.1f} MB)")
+        del store
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    inserts = subparsers.add_parser('inserts', help=bench_inserts.__doc__)
+    inserts.add_argument('--count', type=int, default=2000)
+    inserts.set_defaults(func=bench_inserts)
+
+    startup = subparsers.add_parser('startup', help=bench_startup.__doc__)
+    startup.add_argument('--runs', type=int, default=5)
+    startup.add_argument('--users', type=int, default=2000)
+    startup.set_defaults(func=bench_startup)
+
+    memory = subparsers.add_parser('memory', help=bench_memory.__doc__)
+    memory.add_argument('--sessions', type=int, default=100000)
+    memory.set_defaults(func=bench_memory)
+
+    navigation = subparsers.add_parser('navigation', help=bench_navigation.__doc__)
+    navigation.add_argument('--count', type=int, default=5000)
+    navigation.add_argument('--users', type=int, default=100)
+    navigation.set_defaults(func=bench_navigation)
+
+    learner = subparsers.add_parser('learner', help=bench_learner.__doc__)
+    learner.add_argument('--sizes', default='10000,100000,1000000')
+    learner.add_argument('--queries', type=int, default=200)
+    learner.set_defaults(func=bench_learner)
+
+    matchers = subparsers.add_parser('matchers', help=bench_matchers.__doc__)
+    matchers.add_argument('--size', type=int, default=100000)
+    matchers.add_argument('--queries', type=int, default=1000)
+    matchers.add_argument('--threshold', type=float, default=0.8)
+    matchers.add_argument('--configs', default='64:8,64:16,64:32,128:32')
+    matchers.set_defaults(func=bench_matchers)
+
+    tfidf = subparsers.add_parser('tfidf', help=bench_tfidf.__doc__)
+    tfidf.add_argument('--size', type=int, default=100000)
+    tfidf.add_argument('--queries', type=int, default=1000)
+    tfidf.add_argument('--batch', type=int, default=10)
+    tfidf.set_defaults(func=bench_tfidf)
+
+    normalize = subparsers.add_parser('normalize', help=bench_normalize.__doc__)
+    normalize.add_argument('--count', type=int, default=200000)
+    normalize.add_argument('--distinct', type=int, default=2000)
+    normalize.set_defaults(func=bench_normalize)
+
+    coldstart = subparsers.add_parser('coldstart', help=bench_coldstart.__doc__)
+    coldstart.add_argument('--sizes', default='10000,100000,1000000')
+    coldstart.add_argument('--matcher', default='exact')
+    coldstart.set_defaults(func=bench_coldstart)
+
+    responses = subparsers.add_parser('responses', help=bench_responses.__doc__)
+    responses.add_argument('--events', type=int, default=500000)
+    responses.add_argument('--patterns', type=int, default=50000)
+    responses.add_argument('--cap', type=int, default=10000)
+    responses.set_defaults(func=bench_responses)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import os
+import threading
+from collections import defaultdict
+from logger import logger
+
+class ChangeFeed:
+    """Polls the trigger-maintained change_log and hands new row keys to subscribers
+
+    Every worker process runs its own feed, so a change written by one worker
+    reaches the others within one poll interval without touching the request path.
+    """
+
+    def __init__(self, db, interval=None, batch_size=None, retention=None):
+        self.db = db
+        self.interval = interval or float(os.getenv('CHANGE_FEED_INTERVAL', 2.0))
+        self.batch_size = batch_size or int(os.getenv('CHANGE_FEED_BATCH', 500))
+        # Log rows kept behind the newest one; older rows are pruned
+        self.retention = retention or int(os.getenv('CHANGE_LOG_RETENTION', 100000))
+        self.subscribers = defaultdict(list)
+        self.last_seq = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.polls = 0
+        self.applied = 0
+        self.errors = 0
+
+    def subscribe(self, table_name, callback):
+        """Call callback(row_keys) with the keys of changed rows in a table"""
+        self.subscribers[table_name].append(callback)
+
+    def start(self, since=None):
+        """Start polling from a log position; defaults to the current end of the log"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.last_seq = self.db.get_last_change_seq() if since is None else since
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._poll_loop, name='change-feed', daemon=True)
+            self.thread.start()
+
+    def poll(self):
+        """Apply every change logged since the last poll, returning how many were read"""
+        with self.lock:
+            total = 0
+            while True:
+                changes = self.db.get_changes_since(self.last_seq, self.batch_size)
+                if not changes:
+                    break
+                keys = defaultdict(list)
+                for seq, table_name, row_key in changes:
+                    keys[table_name].append(row_key)
+                for table_name, row_keys in keys.items():
+                    for callback in self.subscribers.get(table_name, ()):
+                        callback(row_keys)
+                # Advance only after subscribers applied the batch
+                self.last_seq = changes[-1][0]
+                total += len(changes)
+                if len(changes) < self.batch_size:
+                    break
+            self.polls += 1
+            self.applied += total
+            if self.polls % 100 == 0:
+                self.db.prune_changes(self.last_seq - self.retention)
+            return total
+
+    def _poll_loop(self):
+        """Poll until stopped"""
+        while not self.stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error polling change feed: {str(e)}")
+
+    def stop(self, timeout=5):
+        """Stop the polling thread"""
+        self.stopped.set()
+        thread, self.thread = self.thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def get_stats(self):
+        """Get log position and poll counters"""
+        return {
+            'running': self.thread is not None,
+            'last_seq': self.last_seq,
+            'interval': self.interval,
+            'polls': self.polls,
+            'applied': self.applied,
+            'errors': self.errors
+        }
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from logger import logger
+from text_normalizer import normalize
+
+# Words that point back at an earlier turn, so the answer depends on the history
+FOLLOWUP_WORDS = frozenset([
+    'it', 'that', 'this', 'those', 'these', 'them', 'he', 'she', 'they', 'again',
+    'more', 'else', 'also', 'why', 'yes', 'ok', 'okay',
+    'هذا', 'هذه', 'ذلك', 'تلك', 'هو', 'هي', 'هم', 'نعم', 'ايضا', 'لماذا', 'اكثر', 'مره', 'اخري',
+])
+
+class CompletionCache:
+    """AI completions keyed on the normalised message, relevant context and prompt version
+
+    An in-process LRU with a TTL sits in front of an optional SQLite tier shared
+    by every worker. Turns that depend on earlier messages bypass the cache, and
+    so does every turn of a user who already has history in the prompt window.
+    """
+
+    def __init__(self, db=None, capacity=None, ttl=None, persistent=None, enabled=None):
+        self.db = db
+        if enabled is None:
+            enabled = os.getenv('COMPLETION_CACHE', 'true').lower() == 'true'
+        self.enabled = enabled
+        self.capacity = capacity or int(os.getenv('COMPLETION_CACHE_SIZE', 5000))
+        self.ttl = ttl or float(os.getenv('COMPLETION_CACHE_TTL', 86400))
+        if persistent is None:
+            persistent = os.getenv('COMPLETION_CACHE_PERSIST', 'false').lower() == 'true'
+        self.persistent = persistent and db is not None
+        # Messages with fewer words are usually replies to the previous turn
+        self.min_words = int(os.getenv('COMPLETION_CACHE_MIN_WORDS', 2))
+        # Context keys that shape the answer; empty means the whole context
+        keys = os.getenv('COMPLETION_CACHE_CONTEXT_KEYS', '')
+        self.context_keys = [key.strip() for key in keys.split(',') if key.strip()]
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.bypasses = {}
+        self.evictions = 0
+        self.expirations = 0
+        self.stores = 0
+        self.errors = 0
+
+    def bypass_reason(self, message, history=None):
+        """Get why a turn must not be cached, or None if it can be"""
+        # The prompt would carry this user's own turns, so the answer is theirs alone
+        if history:
+            return 'history'
+        words = normalize(message).split()
+        if len(words) < self.min_words:
+            return 'short_message'
+        if FOLLOWUP_WORDS.intersection(words):
+            return 'followup'
+        return None
+
+    def make_key(self, message, context, model, prompt_version, history=None):
+        """Get the cache key for a turn, or None if the turn bypasses the cache"""
+        if not self.enabled:
+            return None
+        reason = self.bypass_reason(message, history)
+        if reason:
+            with self.lock:
+                self.bypasses[reason] = self.bypasses.get(reason, 0) + 1
+            return None
+        if context and self.context_keys:
+            context = {key: context[key] for key in self.context_keys if key in context}
+        payload = json.dumps(
+            [prompt_version, model, normalize(message), context or {}],
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Get a fresh cached completion, or None"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                response, created_at = entry
+                if now - created_at <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self.entries[key]
+                self.expirations += 1
+        if self.persistent:
+            try:
+                row = self.db.get_cached_completion(key, now - self.ttl)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error reading completion cache: {str(e)}")
+                row = None
+            if row:
+                with self.lock:
+                    self.persistent_hits += 1
+                    self._remember(key, row[0], row[1])
+                return row[0]
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, response):
+        """Cache a completion in memory and, if enabled, in SQLite"""
+        created_at = time.time()
+        with self.lock:
+            self._remember(key, response, created_at)
+            self.stores += 1
+            prune = self.persistent and self.stores % 1000 == 0
+        if self.persistent:
+            try:
+                self.db.save_cached_completion(key, response, created_at)
+                if prune:
+                    self.db.prune_cached_completions(created_at - self.ttl)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error writing completion cache: {str(e)}")
+
+    def _remember(self, key, response, created_at):
+        """Insert into the LRU; caller holds the lock"""
+        self.entries[key] = (response, created_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self):
+        """Get hit rate, upstream calls saved and bypass counts"""
+        hits = self.hits + self.persistent_hits
+        lookups = hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'persistent': self.persistent,
+            'size': len(self.entries),
+            'capacity': self.capacity,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'persistent_hits': self.persistent_hits,
+            'misses': self.misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'calls_saved': hits,
+            'bypasses': dict(self.bypasses),
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'errors': self.errors
+        }
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Shared pytest fixtures"""
+import atexit
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from conversation_learner import ConversationLearner
+from database import Database, get_pool
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Path of a fresh database file whose pooled connections are closed after the test"""
+    path = str(tmp_path / 'bot.db')
+    yield path
+    get_pool(path).close_all()
+
+@pytest.fixture
+def db(db_path):
+    return Database(db_path)
+
+@pytest.fixture
+def make_learner(db):
+    """Build learners on the test database, without a snapshot or feed thread unless asked"""
+    learners = []
+
+    def make(**kwargs):
+        kwargs.setdefault('db', db)
+        kwargs.setdefault('snapshot', False)
+        kwargs.setdefault('refresh', False)
+        learner = ConversationLearner(**kwargs)
+        learners.append(learner)
+        return learner
+
+    yield make
+    for learner in learners:
+        learner.close()
+        atexit.unregister(learner.close)
@@ -0,0 +1,68 @@
+import threading
+from database import Database
+from analytics import Analytics
+from session_manager import SessionManager
+from menu_manager import MenuManager
+from ai_engine import AIEngine
+from history_buffer import HistoryBuffer
+from conversation_learner import ConversationLearner
+from stats_manager import StatsManager
+
+class Container:
+    """Builds each shared service once and hands the same instance to every module"""
+
+    def __init__(self, db_path='facebook_bot.db'):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.instances = {}
+
+    def _get(self, name, factory):
+        """Get a component, building it on first use"""
+        instance = self.instances.get(name)
+        if instance is None:
+            with self.lock:
+                instance = self.instances.get(name)
+                if instance is None:
+                    instance = self.instances[name] = factory()
+        return instance
+
+    @property
+    def db(self):
+        return self._get('db', lambda: Database(self.db_path))
+
+    @property
+    def analytics(self):
+        return self._get('analytics', lambda: Analytics(db=self.db))
+
+    @property
+    def session_manager(self):
+        return self._get('session_manager', lambda: SessionManager(db=self.db))
+
+    @property
+    def menu_manager(self):
+        return self._get('menu_manager', lambda: MenuManager(db=self.db))
+
+    @property
+    def history_buffer(self):
+        return self._get('history_buffer', self._build_history_buffer)
+
+    def _build_history_buffer(self):
+        history = HistoryBuffer(self.db)
+        # A user's history is held only while their session is cached
+        self.session_manager.add_eviction_listener(history.discard)
+        return history
+
+    @property
+    def ai_engine(self):
+        return self._get('ai_engine', lambda: AIEngine(db=self.db, history=self.history_buffer))
+
+    @property
+    def conversation_learner(self):
+        return self._get('conversation_learner', lambda: ConversationLearner(db=self.db))
+
+    @property
+    def stats_manager(self):
+        return self._get('stats_manager', lambda: StatsManager(db=self.db))
+
+# Create global component container
+container = Container()
@@ -1,65 +1,190 @@
 from database import Database
-from logger import Logger
-from collections import defaultdict
+from logger import logger
+from response_store import ResponseStore
+from token_index import TokenIndex
+from minhash_index import MinHashIndex
+from text_normalizer import normalize, normalize_arabic
+from snapshot import read_snapshot, write_snapshot
+from change_feed import ChangeFeed
+import atexit
 import json
-import re
+import os
+import threading
+import time
+
+# Similarity matchers selectable with LEARNER_MATCHER
+MATCHERS = {
+    'exact': TokenIndex,
+    'minhash': MinHashIndex,
+}
+
+try:
+    from tfidf_index import TfidfIndex
+    MATCHERS['tfidf'] = TfidfIndex
+except ImportError:
+    # numpy is only needed for the TF-IDF matcher
+    TfidfIndex = None
+
+# Bump when the cleaned-message format or index layout changes
+SNAPSHOT_VERSION = 4
 
 class ConversationLearner:
-    def __init__(self):
-        self.db = Database()
-        self.logger = Logger()
-        self.response_patterns = defaultdict(list)
+    def __init__(self, db=None, matcher=None, snapshot=None, refresh=None):
+        self.db = db or Database()
+        self.logger = logger
+        self.response_patterns = ResponseStore()
+        self.matcher = (matcher or os.getenv('LEARNER_MATCHER', 'exact')).lower()
+        if self.matcher not in MATCHERS:
+            raise ValueError(f"Unknown learner matcher: {self.matcher}")
+        self.index = MATCHERS[self.matcher]()
+        if snapshot is None:
+            snapshot = os.getenv('LEARNER_SNAPSHOT', 'true').lower() == 'true'
+        self.snapshot_path = f"{self.db.db_path}.learner" if snapshot else None
+        # Highest conversation_history id already folded into the patterns
+        self.high_water_mark = 0
+        self.unsaved_patterns = 0
+        # One lock for index and pattern changes and for pickling them into the snapshot
+        self.lock = threading.RLock()
+        self.startup_stats = {}
+        # Feedback learned by other workers arrives through the change log
+        self.change_feed = ChangeFeed(self.db)
+        self.change_feed.subscribe('conversation_history', self.apply_feedback_changes)
         self.load_learned_responses()
+        if refresh is None:
+            refresh = os.getenv('LEARNER_REFRESH', 'true').lower() == 'true'
+        if refresh:
+            self.change_feed.start(since=self.change_feed.last_seq)
+        atexit.register(self.close)
     
     def load_learned_responses(self):
         """Load previously learned responses"""
+        started = time.perf_counter()
+        from_snapshot = False
         try:
-            responses = self.db.get_successful_responses()
-            for message, response in responses:
-                cleaned_message = self.clean_message(message)
-                self.response_patterns[cleaned_message].append(response)
+            from_snapshot = self.load_snapshot()
+            if not from_snapshot:
+                # Changes logged while the rows are read are re-applied by the feed
+                self.change_feed.last_seq = self.db.get_last_change_seq()
+            responses = self.db.get_successful_responses_since(self.high_water_mark)
+            for row_id, message, response in responses:
+                self.add_pattern(self.clean_message(message), response)
+                self.high_water_mark = row_id
+            # Feedback on rows older than the mark arrives as updates, which only the log records
+            changes = self.change_feed.poll()
+            self.startup_stats = {
+                'from_snapshot': from_snapshot,
+                'replayed_rows': len(responses),
+                'replayed_changes': changes,
+                'load_seconds': round(time.perf_counter() - started, 4)
+            }
+            # A short replay is cheaper than rewriting the snapshot; it is saved at exit instead
+            replayed = len(responses) + changes
+            if replayed and (not from_snapshot or replayed * 10 > len(self.index)):
+                self.save_snapshot()
         except Exception as e:
             self.logger.error(f"Error loading learned responses: {str(e)}")
     
+    def load_snapshot(self):
+        """Restore patterns and index from the snapshot if it matches this database and matcher"""
+        if not self.snapshot_path:
+            return False
+        try:
+            state = read_snapshot(self.snapshot_path)
+        except Exception as e:
+            self.logger.error(f"Error reading learner snapshot: {str(e)}")
+            return False
+        if not state or state.get('version') != SNAPSHOT_VERSION or state.get('matcher') != self.matcher:
+            return False
+        # A mark past the last row means the database was replaced since the snapshot
+        if state['high_water_mark'] > self.db.get_last_conversation_id():
+            return False
+        # Changes since the snapshot must still be in the log, or feedback would be missed
+        first_seq = self.db.get_first_change_seq()
+        if state['change_seq'] > self.db.get_last_change_seq():
+            return False
+        if first_seq is not None and first_seq > state['change_seq'] + 1:
+            return False
+        self.response_patterns = state['patterns']
+        self.index = state['index']
+        self.high_water_mark = state['high_water_mark']
+        self.change_feed.last_seq = state['change_seq']
+        return True
+    
+    def save_snapshot(self):
+        """Write patterns, index and high-water mark to the snapshot file if anything changed"""
+        if not self.snapshot_path or not self.unsaved_patterns:
+            return
+        # The feed lock keeps polled changes out while the state is pickled; it is
+        # always taken before the learner lock, as poll() holds it while applying
+        with self.change_feed.lock, self.lock:
+            try:
+                write_snapshot(self.snapshot_path, {
+                    'version': SNAPSHOT_VERSION,
+                    'matcher': self.matcher,
+                    'high_water_mark': self.high_water_mark,
+                    'change_seq': self.change_feed.last_seq,
+                    'patterns': self.response_patterns,
+                    'index': self.index
+                })
+                self.unsaved_patterns = 0
+            except Exception as e:
+                self.logger.error(f"Error writing learner snapshot: {str(e)}")
+    
+    def apply_feedback_changes(self, row_keys):
+        """Learn feedback logged by any worker, skipping responses already known"""
+        rows = self.db.get_learned_rows([int(key) for key in row_keys])
+        with self.lock:
+            for row_id, message, response in rows:
+                cleaned_message = self.clean_message(message)
+                if response not in self.response_patterns.get(cleaned_message, ()):
+                    self.add_pattern(cleaned_message, response)
+                self.high_water_mark = max(self.high_water_mark, row_id)
+    
+    def close(self):
+        """Stop the change feed and save the snapshot"""
+        self.change_feed.stop()
+        self.save_snapshot()
+    
+    def add_pattern(self, cleaned_message, response):
+        """Remember a response for a cleaned message and index the message"""
+        with self.lock:
+            self.index.add(cleaned_message)
+            evicted = self.response_patterns.add(cleaned_message, response)
+            if evicted:
+                for message in evicted:
+                    self.index.discard(message)
+                # Evicted messages only stop matching, so rebuild once they are most of the index
+                if len(self.index.removed) * 2 > len(self.index):
+                    self.rebuild_index()
+            self.unsaved_patterns += 1
+    
+    def rebuild_index(self):
+        """Replace the index with one holding only the stored patterns"""
+        with self.lock:
+            index = MATCHERS[self.matcher]()
+            for message in list(self.response_patterns.patterns):
+                index.add(message)
+            self.index = index
+    
     def clean_message(self, message):
         """Clean and normalize message text"""
-        # Convert to lowercase and remove extra whitespace
-        message = message.lower().strip()
-        # Remove punctuation
-        message = re.sub(r'[^\w\s]', '', message)
-        # Normalize Arabic text
-        message = self.normalize_arabic(message)
-        return message
+        return normalize(message)
     
     def normalize_arabic(self, text):
         """Normalize Arabic text by removing diacritics and normalizing characters"""
-        # Remove Arabic diacritics
-        text = re.sub(r'[\u064B-\u065F]', '', text)
-        # Normalize Arabic characters
-        replacements = {
-            'أ': 'ا',
-            'إ': 'ا',
-            'آ': 'ا',
-            'ة': 'ه',
-            'ى': 'ي',
-        }
-        for old, new in replacements.items():
-            text = text.replace(old, new)
-        return text
+        return normalize_arabic(text)
     
     def find_similar_message(self, message, threshold=0.8):
         """Find similar message in learned responses"""
         cleaned_message = self.clean_message(message)
-        best_match = None
-        best_score = 0
-        
-        for learned_message in self.response_patterns.keys():
-            score = self.calculate_similarity(cleaned_message, learned_message)
-            if score > threshold and score > best_score:
-                best_match = learned_message
-                best_score = score
-        
-        return best_match, best_score
+        return self.index.best_match(cleaned_message, threshold)
+    
+    def find_similar_messages(self, messages, threshold=0.8):
+        """Find similar learned messages for a batch of messages"""
+        cleaned_messages = [self.clean_message(message) for message in messages]
+        if hasattr(self.index, 'best_matches'):
+            return self.index.best_matches(cleaned_messages, threshold)
+        return [self.index.best_match(message, threshold) for message in cleaned_messages]
     
     def calculate_similarity(self, message1, message2):
         """Calculate similarity between two messages"""
@@ -85,7 +210,7 @@ class ConversationLearner:
                 if conversation and conversation['is_bot']:
                     # Add to learned responses
                     cleaned_message = self.clean_message(conversation['message'])
-                    self.response_patterns[cleaned_message].append(conversation['response'])
+                    self.add_pattern(cleaned_message, conversation['response'])
                     
                     # Save to database
                     self.db.save_custom_response(
@@ -99,13 +224,23 @@ class ConversationLearner:
             except Exception as e:
                 self.logger.error(f"Error learning from feedback: {str(e)}")
     
+    def get_stats(self):
+        """Get matcher type, index and response store sizes and how the learner started"""
+        stats = self.index.get_stats()
+        stats['matcher'] = self.matcher
+        stats['high_water_mark'] = self.high_water_mark
+        stats['startup'] = self.startup_stats
+        stats['change_feed'] = self.change_feed.get_stats()
+        stats['responses'] = self.response_patterns.get_stats()
+        return stats
+    
     def get_learned_response(self, message):
         """Get learned response for a message"""
         similar_message, confidence = self.find_similar_message(message)
         
-        if similar_message and self.response_patterns[similar_message]:
-            # Return the most recent learned response
-            response = self.response_patterns[similar_message][-1]
+        # The most recent learned response, counted as a hit for eviction
+        response = self.response_patterns.latest(similar_message) if similar_message else None
+        if response:
             return {
                 'text': response,
                 'confidence': confidence,
@@ -113,6 +248,3 @@ class ConversationLearner:
             }
         
         return None
-
-# Create global conversation learner instance
-conversation_learner = ConversationLearner()
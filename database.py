@@ -1,18 +1,195 @@
 import sqlite3
 import json
 import os
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from logger import logger
+from text_normalizer import normalize
 
 load_dotenv()
 
+JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+def _rekey_responses(conn):
+    """Re-key saved responses by their normalized trigger, resolving collisions"""
+    rows = conn.execute(
+        'SELECT trigger, response, confidence, learned, created_at FROM responses ORDER BY created_at, rowid'
+    ).fetchall()
+    groups = {}
+    for row in rows:
+        groups.setdefault(normalize(row[0]), []).append(row)
+    for key, group in groups.items():
+        # A row already under the normalized key is the one being served; otherwise the newest wins
+        winner = next((row for row in group if row[0] == key), group[-1])
+        for row in group:
+            if row[0] != key:
+                conn.execute('DELETE FROM responses WHERE trigger = ?', (row[0],))
+        if winner[0] != key:
+            conn.execute(
+                'INSERT INTO responses (trigger, response, confidence, learned, created_at) VALUES (?, ?, ?, ?, ?)',
+                (key,) + tuple(winner[1:])
+            )
+
+# Versioned schema migrations, applied in order and tracked in PRAGMA user_version.
+# Append new entries; never edit one that has already shipped.
+MIGRATIONS = [
+    (1, 'Index conversation history for per-user, time and feedback lookups', [
+        'CREATE INDEX IF NOT EXISTS idx_conversation_history_user_ts ON conversation_history (user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_conversation_history_ts ON conversation_history (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_conversation_history_date ON conversation_history (DATE(timestamp))',
+        'CREATE INDEX IF NOT EXISTS idx_conversation_history_feedback ON conversation_history (is_bot, feedback)',
+    ]),
+    (2, 'Index analytics interactions by time and type', [
+        'CREATE INDEX IF NOT EXISTS idx_interactions_ts_user ON interactions (timestamp, user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_interactions_date ON interactions (DATE(timestamp))',
+        'CREATE INDEX IF NOT EXISTS idx_interactions_type ON interactions (interaction_type)',
+    ]),
+    (3, 'Version-stamp conversation state for cross-worker updates', [
+        'ALTER TABLE conversations ADD COLUMN version INTEGER NOT NULL DEFAULT 0',
+    ]),
+    (4, 'Log learned-response changes for cross-worker refresh', [
+        '''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_key TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_conversation_history_feedback_insert
+        AFTER INSERT ON conversation_history WHEN NEW.is_bot = 1 AND NEW.feedback > 0
+        BEGIN
+            INSERT INTO change_log (table_name, row_key) VALUES ('conversation_history', NEW.id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_conversation_history_feedback_update
+        AFTER UPDATE OF feedback ON conversation_history WHEN NEW.is_bot = 1 AND NEW.feedback > 0
+        BEGIN
+            INSERT INTO change_log (table_name, row_key) VALUES ('conversation_history', NEW.id);
+        END
+        ''',
+    ]),
+    (5, 'Persist AI completions shared by every worker', [
+        '''
+        CREATE TABLE IF NOT EXISTS completion_cache (
+            cache_key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_completion_cache_created ON completion_cache (created_at)',
+    ]),
+    (6, 'Re-key custom responses by normalized trigger', [
+        _rekey_responses,
+    ]),
+]
+
+class ConnectionPool:
+    """Thread-local SQLite connections opened once with tuned pragmas"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.journal_mode = os.getenv('SQLITE_JOURNAL_MODE', 'WAL').upper()
+        self.synchronous = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+        self.cache_size = int(os.getenv('SQLITE_CACHE_SIZE', -16000))  # negative values are KiB
+        self.mmap_size = int(os.getenv('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))
+        self.busy_timeout = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # milliseconds
+        if self.journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Unsupported SQLITE_JOURNAL_MODE: {self.journal_mode}")
+        if self.synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Unsupported SQLITE_SYNCHRONOUS: {self.synchronous}")
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.connections = []
+        self.pid = os.getpid()
+
+    def _connect(self):
+        """Open a connection and apply the configured pragmas"""
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout / 1000, check_same_thread=False)
+        conn.execute(f'PRAGMA journal_mode={self.journal_mode}')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        conn.execute(f'PRAGMA cache_size={self.cache_size}')
+        conn.execute(f'PRAGMA mmap_size={self.mmap_size}')
+        conn.execute(f'PRAGMA busy_timeout={self.busy_timeout}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def get(self):
+        """Get this thread's connection, opening it on first use"""
+        if os.getpid() != self.pid:
+            # Connections must not be shared with a forked worker process
+            with self.lock:
+                if os.getpid() != self.pid:
+                    self.local = threading.local()
+                    self.connections = []
+                    self.pid = os.getpid()
+
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Use this thread's connection as a transaction that commits on success"""
+        conn = self.get()
+        with conn:
+            yield conn
+
+    def close_all(self):
+        """Close every connection opened by this pool"""
+        with self.lock:
+            connections, self.connections = self.connections, []
+            self.local = threading.local()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+_pools = {}
+_pools_lock = threading.Lock()
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+def get_pool(db_path):
+    """Get the shared connection pool for a database file"""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path)
+        return pool
+
 class Database:
-    def __init__(self):
-        self.db_path = 'facebook_bot.db'
-        self._init_db()
+    def __init__(self, db_path='facebook_bot.db'):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self._ensure_schema()
+    
+    def _ensure_schema(self):
+        """Create tables and apply migrations once per database file per process"""
+        key = os.path.abspath(self.db_path)
+        with _schema_lock:
+            if key not in _schema_ready:
+                self._init_db()
+                _schema_ready.add(key)
+    
+    def get_connection(self):
+        """Get a pooled connection as a transaction context manager"""
+        return self.pool.connection()
         
     def _init_db(self):
         """Initialize database tables"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             
             # Create templates table
@@ -55,11 +232,58 @@ class Database:
                 )
             ''')
             
+            # Create analytics interactions table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS interactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT,
+                    interaction_type TEXT,
+                    content TEXT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Create analytics metrics table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS metrics (
+                    date DATE,
+                    metric_name TEXT,
+                    value INTEGER,
+                    PRIMARY KEY (date, metric_name)
+                )
+            ''')
+            
             conn.commit()
+            self._migrate(conn)
+    
+    def _migrate(self, conn):
+        """Apply pending schema migrations to an existing database"""
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for target, description, statements in MIGRATIONS:
+            if target <= version:
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Another worker may have applied it while we waited for the lock
+                if conn.execute('PRAGMA user_version').fetchone()[0] >= target:
+                    conn.rollback()
+                    continue
+                for statement in statements:
+                    # A step is SQL, or a function for data that SQL cannot transform
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {target}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            logger.info(f"Applied schema migration {target}: {description}")
 
     def save_template(self, template_name, template_data):
         """Save a new template to database"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 'INSERT OR REPLACE INTO templates (name, data) VALUES (?, ?)',
@@ -69,7 +293,7 @@ class Database:
     
     def get_template(self, template_name):
         """Get template by name"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT data FROM templates WHERE name = ?', (template_name,))
             result = cursor.fetchone()
@@ -77,7 +301,7 @@ class Database:
     
     def list_templates(self):
         """Get all templates"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT name, data FROM templates')
             templates = []
@@ -89,25 +313,67 @@ class Database:
             return templates
     def save_conversation_state(self, user_id, state):
         """Save conversation state for a user"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                'INSERT OR REPLACE INTO conversations (user_id, state) VALUES (?, ?)',
+                '''
+                INSERT INTO conversations (user_id, state) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, version = version + 1
+                ''',
                 (user_id, json.dumps(state))
             )
             conn.commit()
     
+    def save_conversation_states(self, updates):
+        """Compare-and-set conversation states for many users in one write transaction"""
+        # updates holds (user_id, expected_version, state, merge) tuples; when another
+        # worker has moved a row on, merge(stored_state) builds the state to write instead
+        results = []
+        with self.get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            for user_id, expected_version, state, merge in updates:
+                row = conn.execute(
+                    'SELECT state, version FROM conversations WHERE user_id = ?', (user_id,)
+                ).fetchone()
+                current_version = row[1] if row else 0
+                conflicted = current_version != expected_version
+                if conflicted:
+                    state = merge(json.loads(row[0]) if row else None)
+                conn.execute(
+                    '''
+                    INSERT INTO conversations (user_id, state, version) VALUES (?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, version = excluded.version
+                    ''',
+                    (user_id, json.dumps(state), current_version + 1)
+                )
+                results.append((state, current_version + 1, conflicted))
+        return results
+    
     def get_conversation_state(self, user_id):
         """Get conversation state for a user"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT state FROM conversations WHERE user_id = ?', (user_id,))
             result = cursor.fetchone()
             return json.loads(result[0]) if result else None
     
+    def get_conversation_record(self, user_id):
+        """Get conversation state and its version for a user"""
+        with self.get_connection() as conn:
+            result = conn.execute(
+                'SELECT state, version FROM conversations WHERE user_id = ?', (user_id,)
+            ).fetchone()
+            return (json.loads(result[0]), result[1]) if result else (None, 0)
+    
+    def get_conversation_version(self, user_id):
+        """Get the version of a user's stored conversation state"""
+        with self.get_connection() as conn:
+            result = conn.execute('SELECT version FROM conversations WHERE user_id = ?', (user_id,)).fetchone()
+            return result[0] if result else 0
+    
     def save_custom_response(self, trigger, response_data, confidence=None, learned=False):
         """Save custom response for specific trigger words"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 '''
@@ -121,7 +387,7 @@ class Database:
     
     def get_custom_response(self, trigger):
         """Get custom response for trigger words"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 'SELECT response, confidence, learned FROM responses WHERE trigger = ?',
@@ -138,7 +404,7 @@ class Database:
             
     def save_conversation(self, user_id, message, response, is_bot=False):
         """Save conversation history"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 '''
@@ -153,7 +419,7 @@ class Database:
     
     def get_conversation(self, conversation_id):
         """Get specific conversation by ID"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 'SELECT user_id, message, response, is_bot FROM conversation_history WHERE id = ?',
@@ -171,7 +437,7 @@ class Database:
     
     def get_conversation_history(self, user_id, limit=10):
         """Get conversation history for a user"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 '''
@@ -195,7 +461,7 @@ class Database:
     
     def save_feedback(self, conversation_id, feedback):
         """Save user feedback for a conversation"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 'UPDATE conversation_history SET feedback = ? WHERE id = ?',
@@ -205,7 +471,7 @@ class Database:
     
     def get_successful_responses(self, min_feedback=1):
         """Get responses that received positive feedback"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 '''
@@ -216,3 +482,81 @@ class Database:
                 (min_feedback,)
             )
             return cursor.fetchall()
+    
+    def get_successful_responses_since(self, after_id, min_feedback=1):
+        """Get (id, message, response) rows with positive feedback added after a row id"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                '''
+                SELECT id, message, response
+                FROM conversation_history
+                WHERE id > ? AND is_bot = 1 AND feedback >= ?
+                ORDER BY id
+                ''',
+                (after_id, min_feedback)
+            ).fetchall()
+    
+    def get_last_conversation_id(self):
+        """Get the highest conversation history row id"""
+        with self.get_connection() as conn:
+            return conn.execute('SELECT MAX(id) FROM conversation_history').fetchone()[0] or 0
+    
+    def get_learned_rows(self, conversation_ids):
+        """Get (id, message, response) for bot replies with positive feedback among the given ids"""
+        if not conversation_ids:
+            return []
+        placeholders = ','.join('?' * len(conversation_ids))
+        with self.get_connection() as conn:
+            return conn.execute(
+                f'''
+                SELECT id, message, response
+                FROM conversation_history
+                WHERE id IN ({placeholders}) AND is_bot = 1 AND feedback > 0
+                ORDER BY id
+                ''',
+                list(conversation_ids)
+            ).fetchall()
+    
+    def get_changes_since(self, seq, limit=500):
+        """Get (seq, table_name, row_key) change log entries after a position"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                'SELECT seq, table_name, row_key FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?',
+                (seq, limit)
+            ).fetchall()
+    
+    def get_first_change_seq(self):
+        """Get the oldest change log position still kept, or None if the log is empty"""
+        with self.get_connection() as conn:
+            return conn.execute('SELECT MIN(seq) FROM change_log').fetchone()[0]
+    
+    def get_last_change_seq(self):
+        """Get the newest change log position"""
+        with self.get_connection() as conn:
+            return conn.execute('SELECT MAX(seq) FROM change_log').fetchone()[0] or 0
+    
+    def prune_changes(self, before_seq):
+        """Delete change log entries older than a position"""
+        with self.get_connection() as conn:
+            conn.execute('DELETE FROM change_log WHERE seq < ?', (before_seq,))
+    
+    def get_cached_completion(self, cache_key, created_after):
+        """Get a stored completion and its creation time if it is newer than created_after"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                'SELECT response, created_at FROM completion_cache WHERE cache_key = ? AND created_at > ?',
+                (cache_key, created_after)
+            ).fetchone()
+    
+    def save_cached_completion(self, cache_key, response, created_at):
+        """Store a completion under its cache key"""
+        with self.get_connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO completion_cache (cache_key, response, created_at) VALUES (?, ?, ?)',
+                (cache_key, response, created_at)
+            )
+    
+    def prune_cached_completions(self, created_before):
+        """Delete stored completions created before a time"""
+        with self.get_connection() as conn:
+            conn.execute('DELETE FROM completion_cache WHERE created_at < ?', (created_before,))
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from logger import logger
+from database import get_pool
+
+def event_key(messaging_event):
+    """Get the idempotency key for a webhook messaging event"""
+    sender_id = messaging_event.get('sender', {}).get('id')
+
+    message = messaging_event.get('message')
+    if message and message.get('mid'):
+        return f"mid:{message['mid']}"
+
+    postback = messaging_event.get('postback')
+    if postback:
+        if postback.get('mid'):
+            return f"postback:{postback['mid']}"
+        return f"postback:{sender_id}:{messaging_event.get('timestamp')}:{postback.get('payload')}"
+
+    for kind in ('delivery', 'read'):
+        watermark = messaging_event.get(kind, {}).get('watermark')
+        if watermark:
+            return f"{kind}:{sender_id}:{watermark}"
+    return None
+
+class EventDeduplicator:
+    """Bounded, time-expiring record of webhook events already processed"""
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, ttl=None, max_size=None, backend=None, db_path='facebook_bot.db'):
+        self.ttl = ttl or float(os.getenv('DEDUP_TTL', 3600))
+        self.max_size = max_size or int(os.getenv('DEDUP_MAX_SIZE', 100000))
+        self.backend = backend or os.getenv('DEDUP_BACKEND', 'memory')
+        self.db_path = db_path if self.backend == 'sqlite' else None
+        self.pool = get_pool(db_path) if self.db_path else None
+        self.seen = OrderedDict()
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.suppressed = 0
+        self.claims = 0
+        if self.db_path:
+            self._init_db()
+
+    def _init_db(self):
+        """Initialize the shared processed events table"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS processed_events (
+                    event_key TEXT PRIMARY KEY,
+                    expires_at REAL
+                )
+            ''')
+            conn.commit()
+
+    def _remember(self, key, now):
+        """Record a key in memory, dropping expired and oldest entries"""
+        self.seen[key] = now + self.ttl
+        self.seen.move_to_end(key)
+        while self.seen:
+            oldest_key, expires_at = next(iter(self.seen.items()))
+            if expires_at > now and len(self.seen) <= self.max_size:
+                break
+            del self.seen[oldest_key]
+
+    def _claim(self, key, now):
+        """Atomically claim a key in SQLite, returning False if another worker has it"""
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO processed_events (event_key, expires_at)
+                    VALUES (?, ?)
+                    ON CONFLICT(event_key) DO UPDATE SET
+                    expires_at = excluded.expires_at
+                    WHERE processed_events.expires_at <= ?
+                ''', (key, now + self.ttl, now))
+                claimed = cursor.rowcount > 0
+
+                self.claims += 1
+                if self.claims % self.PURGE_EVERY == 0:
+                    cursor.execute('DELETE FROM processed_events WHERE expires_at <= ?', (now,))
+                conn.commit()
+                return claimed
+        except Exception as e:
+            # Fail open: a missed duplicate is better than a dropped message
+            logger.error(f"Error claiming webhook event: {str(e)}")
+            return True
+
+    def is_duplicate(self, key):
+        """Check an event key, recording it as processed if it is new"""
+        if key is None:
+            return False
+        now = time.time()
+        with self.lock:
+            self.checked += 1
+            expires_at = self.seen.get(key)
+            if expires_at is not None and expires_at > now:
+                self.suppressed += 1
+                return True
+            self._remember(key, now)
+
+        if self.db_path and not self._claim(key, now):
+            with self.lock:
+                self.suppressed += 1
+            return True
+        return False
+
+    def release(self, key):
+        """Forget a key claimed by is_duplicate so a redelivery of the event is processed"""
+        if key is None:
+            return
+        with self.lock:
+            self.seen.pop(key, None)
+        if self.db_path:
+            try:
+                with self.pool.connection() as conn:
+                    conn.execute('DELETE FROM processed_events WHERE event_key = ?', (key,))
+            except Exception as e:
+                logger.error(f"Error releasing webhook event: {str(e)}")
+
+    def get_stats(self):
+        """Get deduplication counters"""
+        with self.lock:
+            return {
+                'backend': self.backend,
+                'checked': self.checked,
+                'suppressed': self.suppressed,
+                'cached_keys': len(self.seen),
+                'ttl': self.ttl
+            }
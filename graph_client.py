@@ -0,0 +1,220 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from logger import logger
+from metrics import LatencyHistogram
+
+load_dotenv()
+
+# Graph API error codes for page, app and user level throttling
+THROTTLING_ERROR_CODES = {4, 17, 32, 613}
+# Graph API error codes for temporary failures that are safe to retry
+TRANSIENT_ERROR_CODES = THROTTLING_ERROR_CODES | {1, 2, 1200}
+
+class GraphAPIError(Exception):
+    """Error response returned by the Graph API"""
+
+    def __init__(self, status, message, code=None, retry_after=None):
+        super().__init__(f"Graph API error {status}: {message}")
+        self.status = status
+        self.code = code
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_response(cls, status, body, headers=None):
+        """Build an error from an HTTP response"""
+        message, code = body, None
+        try:
+            error = json.loads(body).get('error', {})
+            message = error.get('message', body)
+            code = error.get('code')
+        except (ValueError, AttributeError):
+            pass
+
+        retry_after = None
+        if headers and headers.get('Retry-After'):
+            try:
+                retry_after = float(headers['Retry-After'])
+            except ValueError:
+                pass
+        return cls(status, message, code, retry_after)
+
+    @property
+    def is_throttled(self):
+        return self.status == 429 or self.code in THROTTLING_ERROR_CODES
+
+    @property
+    def is_transient(self):
+        return self.is_throttled or self.status >= 500 or self.code in TRANSIENT_ERROR_CODES
+
+class GraphClient:
+    """Shared keep-alive HTTP client for the Messenger Send API"""
+
+    def __init__(self, access_token=None, api_url=None, pool_size=None,
+                 connect_timeout=None, read_timeout=None, keepalive_timeout=None):
+        self.access_token = access_token or os.getenv('PAGE_ACCESS_TOKEN')
+        self.api_url = (api_url or os.getenv('GRAPH_API_URL', 'https://graph.facebook.com/v17.0')).rstrip('/')
+        self.pool_size = pool_size or int(os.getenv('GRAPH_POOL_SIZE', 20))
+        self.connect_timeout = connect_timeout or float(os.getenv('GRAPH_CONNECT_TIMEOUT', 3.05))
+        self.read_timeout = read_timeout or float(os.getenv('GRAPH_READ_TIMEOUT', 10))
+        if keepalive_timeout is None:
+            keepalive_timeout = float(os.getenv('GRAPH_KEEPALIVE_TIMEOUT', 60))
+        self.keepalive_timeout = keepalive_timeout
+
+        self.session = self._create_session()
+        self._async_session = None
+        self._async_loop = None
+
+        self.latency = LatencyHistogram()
+        self.async_latency = LatencyHistogram()
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.errors = 0
+
+    @property
+    def endpoint(self):
+        return f"{self.api_url}/me/messages"
+
+    def _create_session(self):
+        """Create a requests session with a sized connection pool"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'Content-Type': 'application/json'})
+        if not self.keepalive_timeout:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def _params(self):
+        return {'access_token': self.access_token} if self.access_token else {}
+
+    def _payload(self, recipient_id, message):
+        return {
+            "recipient": {"id": recipient_id},
+            "message": message
+        }
+
+    def _record(self, ok):
+        with self.lock:
+            if ok:
+                self.sent += 1
+            else:
+                self.errors += 1
+
+    def send(self, recipient_id, message):
+        """Send a message, raising GraphAPIError on an error response"""
+        started = time.perf_counter()
+        try:
+            response = self.session.post(
+                self.endpoint,
+                json=self._payload(recipient_id, message),
+                params=self._params(),
+                timeout=(self.connect_timeout, self.read_timeout)
+            )
+        except Exception:
+            self._record(False)
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - started)
+
+        if response.status_code >= 400:
+            self._record(False)
+            raise GraphAPIError.from_response(response.status_code, response.text, response.headers)
+        self._record(True)
+        return response.json() if response.content else {}
+
+    async def _get_async_session(self):
+        """Get the aiohttp session bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        session = self._async_session
+        if session is not None and not session.closed and self._async_loop is loop:
+            return session
+
+        stale_session, stale_loop = session, self._async_loop
+        if self.keepalive_timeout:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout)
+        else:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, force_close=True)
+        timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+        # Swapped in before anything is awaited, so concurrent senders share it
+        self._async_session = session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={'Content-Type': 'application/json'}
+        )
+        self._async_loop = loop
+        if stale_session is not None and not stale_session.closed:
+            await self._close_stale_session(stale_session, stale_loop)
+        return session
+
+    async def _close_stale_session(self, session, loop):
+        """Close a session left on a previous event loop so its connections are released"""
+        try:
+            if loop is not None and loop.is_running():
+                # Its connections belong to that loop, so they are closed there
+                asyncio.run_coroutine_threadsafe(session.close(), loop)
+            else:
+                await session.close()
+        except Exception as e:
+            logger.error(f"Error closing Graph API session: {str(e)}")
+
+    async def send_async(self, recipient_id, message):
+        """Send a message from an event loop, raising GraphAPIError on an error response"""
+        session = await self._get_async_session()
+        started = time.perf_counter()
+        try:
+            async with session.post(
+                self.endpoint,
+                json=self._payload(recipient_id, message),
+                params=self._params()
+            ) as response:
+                status = response.status
+                body = await response.text()
+                headers = response.headers
+        except Exception:
+            self._record(False)
+            raise
+        finally:
+            self.async_latency.observe(time.perf_counter() - started)
+
+        if status >= 400:
+            self._record(False)
+            raise GraphAPIError.from_response(status, body, headers)
+        self._record(True)
+        return json.loads(body) if body else {}
+
+    async def aclose(self):
+        """Close the async connection pool"""
+        if self._async_session and not self._async_session.closed:
+            await self._async_session.close()
+        self._async_session = None
+        self._async_loop = None
+
+    def close(self):
+        """Close the sync connection pool"""
+        self.session.close()
+
+    def get_stats(self):
+        """Get send counters and latency histograms"""
+        with self.lock:
+            sent, errors = self.sent, self.errors
+        return {
+            'sent': sent,
+            'errors': errors,
+            'pool_size': self.pool_size,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'keepalive_timeout': self.keepalive_timeout,
+            'latency': self.latency.snapshot(),
+            'async_latency': self.async_latency.snapshot()
+        }
+
+# Create global Graph API client instance
+graph_client = GraphClient()
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+from collections import deque
+
+class HistoryBuffer:
+    """Last MAX_HISTORY_MESSAGES turns per user, kept in memory for prompt building
+
+    A user's ring is filled from conversation_history on first access and
+    appended to as turns are saved, so steady-state lookups skip the database.
+    Rings are dropped when the user's session leaves the session cache.
+    """
+
+    def __init__(self, db, size=None, enabled=None):
+        self.db = db
+        self.size = size or int(os.getenv('MAX_HISTORY_MESSAGES', 10))
+        if enabled is None:
+            # Without sticky routing another worker's turns would be missing from the ring
+            shared = os.getenv('SESSION_SHARED', 'false').lower() == 'true'
+            enabled = os.getenv('HISTORY_BUFFER', 'false' if shared else 'true').lower() == 'true'
+        self.enabled = enabled
+        self.buffers = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.appends = 0
+        self.discards = 0
+
+    def get(self, user_id):
+        """Get a user's recent turns, oldest first"""
+        if not self.enabled:
+            return self.db.get_conversation_history(user_id, limit=self.size)
+        with self.lock:
+            ring = self.buffers.get(user_id)
+            if ring is not None:
+                self.hits += 1
+                return list(ring)
+        loaded = deque(self.db.get_conversation_history(user_id, limit=self.size), maxlen=self.size)
+        with self.lock:
+            # Another lookup for the same user may have loaded it meanwhile
+            ring = self.buffers.setdefault(user_id, loaded)
+            self.loads += 1
+            return list(ring)
+
+    def append(self, user_id, message, response, is_bot):
+        """Record a saved turn in the user's ring if it is loaded"""
+        if not self.enabled:
+            return
+        with self.lock:
+            ring = self.buffers.get(user_id)
+            if ring is None:
+                # The next get loads it, saved turn included
+                return
+            ring.append({
+                'message': message,
+                'response': response,
+                'is_bot': bool(is_bot),
+                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+            })
+            self.appends += 1
+
+    def discard(self, user_id):
+        """Drop a user's ring"""
+        with self.lock:
+            if self.buffers.pop(user_id, None) is not None:
+                self.discards += 1
+
+    def get_stats(self):
+        """Get ring count, hit and load counters"""
+        with self.lock:
+            lookups = self.hits + self.loads
+            return {
+                'enabled': self.enabled,
+                'users': len(self.buffers),
+                'size': self.size,
+                'hits': self.hits,
+                'loads': self.loads,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'appends': self.appends,
+                'discards': self.discards
+            }
@@ -52,9 +52,9 @@ class Menu:
         }
 
 class MenuManager:
-    def __init__(self):
+    def __init__(self, db=None):
         self.menus = {}
-        self.db = Database()
+        self.db = db or Database()
         self._initialize_default_menus()
     
     def _initialize_default_menus(self):
@@ -106,6 +106,3 @@ class MenuManager:
         # Default to main menu if payload not found
         logger.warning(f"Unknown payload: {payload}")
         return self.menus['MAIN'].to_quick_replies()
-
-# Create global menu manager instance
-menu_manager = MenuManager()
@@ -1,8 +1,9 @@
 from templates_manager import TemplateManager
+from graph_client import graph_client
 
 class MessageHandler:
-    def __init__(self, send_message_func):
-        self.send_message = send_message_func
+    def __init__(self, send_message_func=None):
+        self.send_message = send_message_func or graph_client.send
         self.template_manager = TemplateManager()
 
     def handle_text_message(self, sender_id, message_text):
@@ -0,0 +1,73 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram in seconds"""
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all recorded observations"""
+        with self.lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def observe(self, value):
+        """Record a single observation"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    @contextmanager
+    def time(self):
+        """Record the duration of the wrapped block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def percentile(self, percent):
+        """Estimate a percentile as the upper bound of its bucket"""
+        with self.lock:
+            if not self.count:
+                return 0.0
+            rank = self.count * percent / 100.0
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank and count:
+                    if index < len(self.buckets):
+                        return min(self.buckets[index], self.max)
+                    return self.max
+            return self.max
+
+    def snapshot(self):
+        """Get a JSON-serialisable summary of the histogram"""
+        p50, p90, p99 = self.percentile(50), self.percentile(90), self.percentile(99)
+        with self.lock:
+            buckets = {str(bound): count for bound, count in zip(self.buckets, self.counts)}
+            buckets['inf'] = self.counts[-1]
+            return {
+                'count': self.count,
+                'sum': round(self.total, 6),
+                'avg': round(self.total / self.count, 6) if self.count else 0.0,
+                'max': round(self.max, 6),
+                'p50': p50,
+                'p90': p90,
+                'p99': p99,
+                'buckets': buckets
+            }
@@ -0,0 +1,112 @@
+import os
+import random
+import zlib
+
+# Mersenne prime for the universal hash family (a * x + b) mod p
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+class MinHashIndex:
+    """Approximate Jaccard matcher using MinHash signatures and LSH banding
+
+    More bands of fewer rows raise recall at the cost of more candidates to verify.
+    Candidates are verified with exact Jaccard, so a returned match is always genuine.
+    """
+
+    def __init__(self, num_perm=None, bands=None, seed=1):
+        self.num_perm = num_perm or int(os.getenv('LEARNER_MINHASH_PERM', 64))
+        self.bands = bands or int(os.getenv('LEARNER_MINHASH_BANDS', 16))
+        if self.num_perm % self.bands:
+            raise ValueError(f"MinHash permutations ({self.num_perm}) must divide into {self.bands} bands")
+        self.rows = self.num_perm // self.bands
+        # Seeded so signatures are stable across processes and restarts
+        rng = random.Random(seed)
+        self.permutations = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+            for _ in range(self.num_perm)
+        ]
+        self.messages = []
+        self.ids = {}
+        self.buckets = [{} for _ in range(self.bands)]
+        # Ids of discarded messages; they stay bucketed but never match
+        self.removed = set()
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __contains__(self, message):
+        return message in self.ids
+
+    def signature(self, tokens):
+        """Get the MinHash signature of a token set"""
+        hashes = [zlib.crc32(token.encode('utf-8')) for token in tokens]
+        return [
+            min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes)
+            for a, b in self.permutations
+        ]
+
+    def band_keys(self, signature):
+        """Split a signature into one hashable key per band"""
+        rows = self.rows
+        return [tuple(signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def add(self, message):
+        """Sign and bucket a message once; repeated adds keep the original position"""
+        if message in self.ids:
+            message_id = self.ids[message]
+            self.removed.discard(message_id)
+            return message_id
+        message_id = len(self.messages)
+        tokens = frozenset(message.split())
+        self.ids[message] = message_id
+        self.messages.append(message)
+        if tokens:
+            for buckets, key in zip(self.buckets, self.band_keys(self.signature(tokens))):
+                buckets.setdefault(key, []).append(message_id)
+        return message_id
+
+    def candidates(self, tokens):
+        """Get ids of messages sharing at least one band with the query, in insertion order"""
+        found = set()
+        for buckets, key in zip(self.buckets, self.band_keys(self.signature(tokens))):
+            found.update(buckets.get(key, ()))
+        return sorted(found - self.removed) if self.removed else sorted(found)
+
+    def discard(self, message):
+        """Stop matching a message; adding it again restores it"""
+        message_id = self.ids.get(message)
+        if message_id is not None:
+            self.removed.add(message_id)
+
+    def best_match(self, message, threshold):
+        """Get the most similar candidate message above the threshold, and its score"""
+        tokens = frozenset(message.split())
+        if threshold < 0:
+            message_ids = [i for i in range(len(self.messages)) if i not in self.removed]
+        elif not tokens:
+            return None, 0
+        else:
+            message_ids = self.candidates(tokens)
+
+        best_match = None
+        best_score = 0
+        for message_id in message_ids:
+            learned = frozenset(self.messages[message_id].split())
+            if not tokens or not learned:
+                score = 0
+            else:
+                score = len(tokens & learned) / len(tokens | learned)
+            if score > threshold and score > best_score:
+                best_match = self.messages[message_id]
+                best_score = score
+        return best_match, best_score
+
+    def get_stats(self):
+        """Get index size and banding parameters"""
+        return {
+            'messages': len(self.messages),
+            'removed': len(self.removed),
+            'num_perm': self.num_perm,
+            'bands': self.bands,
+            'rows': self.rows
+        }
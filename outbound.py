@@ -0,0 +1,227 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+import requests
+from graph_client import GraphAPIError
+from logger import logger
+from metrics import LatencyHistogram
+
+def is_transient_error(error):
+    """Check whether a failed send is worth retrying"""
+    if isinstance(error, GraphAPIError):
+        return error.is_transient
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate or 0)
+        self.capacity = float(capacity or max(self.rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def acquire(self, tokens=1, timeout=None):
+        """Take tokens, sleeping until they are available"""
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self._refill(now)
+                    if self.tokens >= tokens:
+                        self.tokens -= tokens
+                        return True
+                    wait = (tokens - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for a while, e.g. after being throttled"""
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+class OutboundDispatcher:
+    """Per-recipient FIFO send queue with global rate limiting and retries"""
+
+    def __init__(self, send_func, num_workers=None, rate=None, burst=None, max_retries=None,
+                 base_delay=None, max_delay=None, max_pending=None):
+        self.send_func = send_func
+        self.num_workers = num_workers or int(os.getenv('OUTBOUND_WORKERS', 4))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('OUTBOUND_MAX_RETRIES', 5))
+        self.base_delay = base_delay if base_delay is not None else float(os.getenv('OUTBOUND_BASE_DELAY', 0.5))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv('OUTBOUND_MAX_DELAY', 30))
+        self.max_pending = max_pending or int(os.getenv('OUTBOUND_MAX_PENDING', 10000))
+        rate = rate if rate is not None else float(os.getenv('OUTBOUND_RATE', 40))
+        burst = burst if burst is not None else float(os.getenv('OUTBOUND_BURST', rate))
+        self.bucket = TokenBucket(rate, burst)
+
+        # recipient_id -> deque of (message, enqueued_at); a recipient is
+        # either waiting in self.ready or has exactly one send in flight
+        self.lanes = {}
+        self.ready = deque()
+        self.cond = threading.Condition()
+        self.workers = []
+        self.running = False
+        self.pending = 0
+        self.in_flight = 0
+
+        self.send_lag = LatencyHistogram((0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+        self.sent = 0
+        self.retried = 0
+        self.throttled = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self):
+        """Start the dispatcher worker threads"""
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"outbound-worker-{i}", daemon=True)
+                worker.start()
+                self.workers.append(worker)
+        logger.info(f"Started {self.num_workers} outbound workers")
+
+    def enqueue(self, recipient_id, message):
+        """Queue a message for delivery, returning False if the queue is full"""
+        with self.cond:
+            if self.pending >= self.max_pending:
+                self.dropped += 1
+                logger.warning(f"Outbound queue full, dropping message to {recipient_id}")
+                return False
+            lane = self.lanes.get(recipient_id)
+            if lane is None:
+                lane = self.lanes[recipient_id] = deque()
+                self.ready.append(recipient_id)
+            lane.append((message, time.monotonic()))
+            self.pending += 1
+            self.cond.notify()
+        return True
+
+    def _worker_loop(self):
+        """Deliver the head message of each ready recipient in turn"""
+        while True:
+            with self.cond:
+                while not self.ready and self.running:
+                    self.cond.wait()
+                if not self.ready:
+                    return
+                recipient_id = self.ready.popleft()
+                message, enqueued_at = self.lanes[recipient_id].popleft()
+                self.in_flight += 1
+
+            self._deliver(recipient_id, message, enqueued_at)
+
+            with self.cond:
+                self.in_flight -= 1
+                self.pending -= 1
+                if self.lanes[recipient_id]:
+                    self.ready.append(recipient_id)
+                else:
+                    del self.lanes[recipient_id]
+                self.cond.notify_all()
+
+    def _backoff(self, attempt, error):
+        """Exponential backoff with jitter, honouring Retry-After"""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _deliver(self, recipient_id, message, enqueued_at):
+        """Send one message, retrying transient failures"""
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                self.send_func(recipient_id, message)
+            except Exception as e:
+                throttled = isinstance(e, GraphAPIError) and e.is_throttled
+                if throttled:
+                    with self.cond:
+                        self.throttled += 1
+                if not is_transient_error(e) or attempt == self.max_retries:
+                    with self.cond:
+                        self.failed += 1
+                    logger.error(f"Failed to send message to {recipient_id} after {attempt + 1} attempts: {str(e)}")
+                    return False
+
+                delay = self._backoff(attempt, e)
+                if throttled:
+                    # Page level limits apply to every recipient, not just this one
+                    self.bucket.pause(delay)
+                with self.cond:
+                    self.retried += 1
+                time.sleep(delay)
+                continue
+
+            self.send_lag.observe(time.monotonic() - enqueued_at)
+            with self.cond:
+                self.sent += 1
+            return True
+        return False
+
+    def flush(self, timeout=None):
+        """Wait until every queued message has been handled"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=None):
+        """Drain queued messages and stop the workers"""
+        with self.cond:
+            if not self.running:
+                return
+            self.running = False
+            workers = list(self.workers)
+            self.workers = []
+            self.cond.notify_all()
+        for worker in workers:
+            worker.join(timeout)
+
+    def get_stats(self):
+        """Get queue depth, outcome counters and send lag"""
+        with self.cond:
+            now = time.monotonic()
+            oldest = max((now - lane[0][1] for lane in self.lanes.values() if lane), default=0.0)
+            stats = {
+                'running': self.running,
+                'pending': self.pending,
+                'in_flight': self.in_flight,
+                'recipients': len(self.lanes),
+                'oldest_pending_age': round(oldest, 3),
+                'sent': self.sent,
+                'retried': self.retried,
+                'throttled': self.throttled,
+                'failed': self.failed,
+                'dropped': self.dropped
+            }
+        stats['send_lag'] = self.send_lag.snapshot()
+        return stats
@@ -0,0 +1,152 @@
+import math
+import os
+import threading
+from collections import deque
+
+# Chat format overhead per message and for priming the reply (OpenAI's published counts)
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+TRUNCATION_MARK = '…'
+
+def estimate_tokens(text):
+    """Estimate BPE tokens without a tokenizer: ~4 ASCII or ~2 non-ASCII characters each"""
+    if not text:
+        return 0
+    # Every non-ASCII character adds at least one extra UTF-8 byte
+    non_ascii = len(text.encode('utf-8')) - len(text)
+    ascii_chars = max(len(text) - non_ascii, 0)
+    return math.ceil(ascii_chars / 4 + non_ascii / 2)
+
+def truncate(text, max_tokens):
+    """Cut text to its longest prefix that fits max_tokens, marking the cut"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle] + TRUNCATION_MARK) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + TRUNCATION_MARK if low else ''
+
+class PromptBuilder:
+    """Assembles chat messages within an estimated input token budget
+
+    The system prompt, context and current message always go in, trimmed if
+    they alone exceed the budget. History fills what is left newest first, so
+    the oldest turns are truncated or dropped.
+    """
+
+    def __init__(self, budget=None, context_budget=None, min_turn_tokens=None):
+        self.budget = budget or int(os.getenv('PROMPT_TOKEN_BUDGET', 2000))
+        self.context_budget = context_budget or int(os.getenv('PROMPT_CONTEXT_TOKENS', 200))
+        # A partial turn shorter than this is dropped rather than truncated
+        self.min_turn_tokens = min_turn_tokens or int(os.getenv('PROMPT_MIN_TURN_TOKENS', 32))
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.over_budget = 0
+        self.turns_dropped = 0
+        self.turns_truncated = 0
+        self.recent_tokens = deque(maxlen=1000)
+        self.last = {}
+
+    def _message(self, role, content):
+        return {"role": role, "content": content}, estimate_tokens(content) + TOKENS_PER_MESSAGE
+
+    def _turn(self, entry):
+        """Get the chat messages of one history entry"""
+        messages = [{"role": "user", "content": entry['message']}]
+        if entry['is_bot'] and entry['response']:
+            messages.append({"role": "assistant", "content": entry['response']})
+        return messages
+
+    def _fit_turn(self, turn, available):
+        """Truncate a turn's messages to the available tokens, or None if too little is left"""
+        if available < self.min_turn_tokens:
+            return None
+        fitted = []
+        # Each message keeps an even share of what is left, after the format overhead
+        share = (available - TOKENS_PER_MESSAGE * len(turn)) // len(turn)
+        for message in turn:
+            content = truncate(message['content'], share)
+            if not content:
+                return None
+            fitted.append({"role": message['role'], "content": content})
+        return fitted
+
+    def build(self, system_prompt, history, current_message, context=None):
+        """Build the messages for one request and record its estimated size"""
+        system, system_tokens = self._message("system", system_prompt)
+        used = system_tokens + TOKENS_PER_REPLY
+        context_messages = []
+        if context:
+            content = truncate(f"معلومات السياق: {context}", self.context_budget)
+            message, tokens = self._message("system", content)
+            context_messages.append(message)
+            used += tokens
+        # The current message gets whatever the system prompt and context leave
+        current_budget = max(self.budget - used - TOKENS_PER_MESSAGE, self.min_turn_tokens)
+        current, current_tokens = self._message("user", truncate(current_message, current_budget))
+        used += current_tokens
+
+        kept = []
+        dropped = truncated = 0
+        for position in range(len(history) - 1, -1, -1):
+            turn = self._turn(history[position])
+            tokens = sum(estimate_tokens(m['content']) + TOKENS_PER_MESSAGE for m in turn)
+            if used + tokens <= self.budget:
+                kept.append(turn)
+                used += tokens
+                continue
+            fitted = self._fit_turn(turn, self.budget - used)
+            if fitted:
+                kept.append(fitted)
+                used += sum(estimate_tokens(m['content']) + TOKENS_PER_MESSAGE for m in fitted)
+                truncated += 1
+                dropped += position
+            else:
+                dropped += position + 1
+            break
+
+        messages = [system] + context_messages
+        for turn in reversed(kept):
+            messages.extend(turn)
+        messages.append(current)
+        self._record(used, len(kept), dropped, truncated)
+        return messages
+
+    def _record(self, tokens, turns, dropped, truncated):
+        with self.lock:
+            self.requests += 1
+            self.total_tokens += tokens
+            self.max_tokens = max(self.max_tokens, tokens)
+            self.over_budget += tokens > self.budget
+            self.turns_dropped += dropped
+            self.turns_truncated += truncated
+            self.recent_tokens.append(tokens)
+            self.last = {
+                'tokens': tokens,
+                'turns': turns,
+                'dropped': dropped,
+                'truncated': truncated
+            }
+
+    def get_stats(self):
+        """Get the budget and estimated prompt sizes, overall and for recent requests"""
+        with self.lock:
+            recent = sorted(self.recent_tokens)
+            return {
+                'budget': self.budget,
+                'requests': self.requests,
+                'mean_tokens': round(self.total_tokens / self.requests, 1) if self.requests else 0.0,
+                'p50_tokens': recent[len(recent) // 2] if recent else 0,
+                'p95_tokens': recent[min(len(recent) - 1, len(recent) * 95 // 100)] if recent else 0,
+                'max_tokens': self.max_tokens,
+                'over_budget': self.over_budget,
+                'turns_dropped': self.turns_dropped,
+                'turns_truncated': self.turns_truncated,
+                'last': dict(self.last)
+            }
@@ -0,0 +1,131 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+EVICTION_POLICIES = ('hits', 'recency')
+
+class ResponseStore:
+    """Learned responses per cleaned message, deduplicated and bounded
+
+    Each pattern keeps at most max_alternatives distinct responses, newest last.
+    With max_patterns set, the least matched (hits) or least recently used
+    (recency) patterns are evicted once the store grows past the cap.
+    """
+
+    def __init__(self, max_alternatives=None, max_patterns=None, eviction=None):
+        self.max_alternatives = max_alternatives or int(os.getenv('LEARNER_MAX_ALTERNATIVES', 3))
+        # 0 keeps every pattern
+        self.max_patterns = int(os.getenv('LEARNER_MAX_PATTERNS', 0)) if max_patterns is None else max_patterns
+        self.eviction = (eviction or os.getenv('LEARNER_EVICTION', 'hits')).lower()
+        if self.eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown learner eviction policy: {self.eviction}")
+        # Ordered by last use, so recency eviction pops from the front
+        self.patterns = OrderedDict()
+        self.hits = {}
+        self.lock = threading.Lock()
+        self.duplicates = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        # Limits are configuration, so a restored store takes the current environment's
+        return {
+            'patterns': self.patterns,
+            'hits': self.hits,
+            'duplicates': self.duplicates,
+            'evictions': self.evictions
+        }
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state)
+        # Interning is per process, so re-intern what was unpickled
+        for pattern, responses in self.patterns.items():
+            self.patterns[pattern] = [sys.intern(response) for response in responses]
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __contains__(self, pattern):
+        return pattern in self.patterns
+
+    def __getitem__(self, pattern):
+        return list(self.patterns.get(pattern, ()))
+
+    def get(self, pattern, default=()):
+        """Get the alternatives for a pattern, oldest first"""
+        responses = self.patterns.get(pattern)
+        return list(responses) if responses is not None else default
+
+    def add(self, pattern, response):
+        """Store a response as the newest for a pattern, returning evicted patterns"""
+        if not isinstance(response, str):
+            response = str(response)
+        response = sys.intern(response)
+        with self.lock:
+            responses = self.patterns.get(pattern)
+            if responses is None:
+                responses = self.patterns[pattern] = []
+                self.hits[pattern] = 0
+            elif response in responses:
+                # Already known; it just becomes the newest alternative again
+                responses.remove(response)
+                self.duplicates += 1
+            responses.append(response)
+            del responses[:-self.max_alternatives]
+            self.patterns.move_to_end(pattern)
+            return self._evict()
+
+    def latest(self, pattern):
+        """Get the newest response for a pattern and count the match"""
+        with self.lock:
+            responses = self.patterns.get(pattern)
+            if not responses:
+                return None
+            self.hits[pattern] += 1
+            self.patterns.move_to_end(pattern)
+            return responses[-1]
+
+    def _evict(self):
+        """Drop patterns beyond the cap; caller holds the lock"""
+        if not self.max_patterns or len(self.patterns) <= self.max_patterns:
+            return []
+        # Evict down to 90% of the cap so the hits policy sorts rarely
+        excess = len(self.patterns) - self.max_patterns + self.max_patterns // 10
+        if self.eviction == 'recency':
+            evicted = [pattern for pattern, _ in zip(self.patterns, range(excess))]
+        else:
+            # Least matched first; ties go to the least recently used
+            order = {pattern: position for position, pattern in enumerate(self.patterns)}
+            evicted = sorted(self.patterns, key=lambda pattern: (self.hits[pattern], order[pattern]))[:excess]
+        for pattern in evicted:
+            del self.patterns[pattern]
+            del self.hits[pattern]
+        self.evictions += len(evicted)
+        return evicted
+
+    def memory_footprint(self):
+        """Estimate the bytes held by the store, counting each shared string once"""
+        with self.lock:
+            total = sys.getsizeof(self.patterns) + sys.getsizeof(self.hits)
+            seen = set()
+            for pattern, responses in self.patterns.items():
+                total += sys.getsizeof(pattern) + sys.getsizeof(responses)
+                for response in responses:
+                    if id(response) not in seen:
+                        seen.add(id(response))
+                        total += sys.getsizeof(response)
+            return total
+
+    def get_stats(self):
+        """Get size, deduplication and eviction counters and the memory footprint"""
+        return {
+            'patterns': len(self.patterns),
+            'responses': sum(len(responses) for responses in list(self.patterns.values())),
+            'max_alternatives': self.max_alternatives,
+            'max_patterns': self.max_patterns,
+            'eviction': self.eviction,
+            'duplicates': self.duplicates,
+            'evictions': self.evictions,
+            'memory_bytes': self.memory_footprint()
+        }
@@ -1,77 +1,395 @@
 from database import Database
-from datetime import datetime, timedelta
+from datetime import datetime
+from collections import OrderedDict
+from logger import logger
+import atexit
+import os
+import threading
+import time
+
+DURABILITY_MODES = ('immediate', 'batched')
+
+_MISSING = object()
+
+_shared_db = None
+_shared_db_lock = threading.Lock()
+
+def get_shared_database():
+    """Get the storage handle shared by sessions created without one"""
+    global _shared_db
+    if _shared_db is None:
+        with _shared_db_lock:
+            if _shared_db is None:
+                _shared_db = Database()
+    return _shared_db
+
+def to_epoch(value):
+    """Convert a stored timestamp (epoch seconds or legacy ISO string) to epoch seconds"""
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp())
 
 class ConversationSession:
-    def __init__(self, user_id):
+    """Per-user conversation state, read from storage in one query when the session starts"""
+    
+    __slots__ = ('user_id', 'current_state', 'context', 'last_interaction', 'last_access', 'dirty',
+                 'version', 'changes', 'db', 'owner')
+    
+    def __init__(self, user_id, db=None, owner=None):
         self.user_id = user_id
         self.current_state = None
         self.context = {}
         self.last_interaction = None
-        self.db = Database()
+        self.last_access = time.monotonic()
+        self.dirty = False
+        # Stored row version this copy is based on, and edits made since it was saved
+        self.version = 0
+        self.changes = None
+        self.db = db or get_shared_database()
+        # SessionManager that batches writes; sessions without one save immediately
+        self.owner = owner
     
     def start_session(self):
         """Initialize or resume a session"""
-        stored_state = self.db.get_conversation_state(self.user_id)
+        stored_state, self.version = self.db.get_conversation_record(self.user_id)
+        self.changes = None
         if stored_state:
             self.current_state = stored_state.get('state')
-            self.context = stored_state.get('context', {})
-            last_interaction = stored_state.get('last_interaction')
-            if last_interaction:
-                self.last_interaction = datetime.fromisoformat(last_interaction)
+            # Decoded with the rest of the row, so the context matches self.version
+            self.context = stored_state.get('context') or {}
+            self.last_interaction = to_epoch(stored_state.get('last_interaction'))
         else:
             self.current_state = 'START'
             self.context = {}
-            self.last_interaction = datetime.now()
+            self.last_interaction = int(time.time())
     
     def update_session(self, new_state=None, **context_updates):
         """Update session state and context"""
-        if new_state:
-            self.current_state = new_state
-        
-        self.context.update(context_updates)
-        self.last_interaction = datetime.now()
+        changes = self.changes or {}
+        changed = False
+        if new_state and new_state != self.current_state:
+            self.current_state = changes['state'] = new_state
+            changed = True
         
-        # Save to database
-        session_data = {
+        if context_updates:
+            context = self.context
+            if any(context.get(key, _MISSING) != value for key, value in context_updates.items()):
+                context.update(context_updates)
+                changes.setdefault('context', {}).update(context_updates)
+                changed = True
+        if changed:
+            self.changes = changes
+        self.last_interaction = int(time.time())
+        # A bare touch only moves last_interaction and is not worth a write
+        if changed:
+            self.mark_dirty()
+    
+    def mark_dirty(self):
+        """Flag the session for saving, now or in the owner's next batch"""
+        self.dirty = True
+        if self.owner is not None:
+            self.owner.schedule(self)
+        else:
+            self.persist()
+    
+    def snapshot(self):
+        """Get the serialisable session state"""
+        return {
             'state': self.current_state,
             'context': self.context,
-            'last_interaction': self.last_interaction.isoformat()
+            'last_interaction': self.last_interaction
         }
-        self.db.save_conversation_state(self.user_id, session_data)
+    
+    def merge(self, stored_state):
+        """Reapply unsaved changes on top of a newer stored state"""
+        changes = self.changes or {}
+        stored_state = stored_state or {}
+        context = {} if changes.get('reset') else dict(stored_state.get('context') or {})
+        context.update(changes.get('context', {}))
+        return {
+            'state': changes.get('state', stored_state.get('state', self.current_state)),
+            'context': context,
+            'last_interaction': max(self.last_interaction or 0, to_epoch(stored_state.get('last_interaction')) or 0)
+        }
+    
+    def saved(self, state, version, conflicted):
+        """Adopt the state and version that were written"""
+        if conflicted:
+            self.current_state = state['state']
+            self.context = state['context']
+            self.last_interaction = state['last_interaction']
+        self.version = version
+        self.changes = None
+    
+    def persist(self):
+        """Save session state to the database"""
+        state, version, conflicted = self.db.save_conversation_states(
+            [(self.user_id, self.version, self.snapshot(), self.merge)]
+        )[0]
+        self.saved(state, version, conflicted)
+        self.dirty = False
     
     def is_session_expired(self, timeout_minutes=30):
         """Check if session has expired"""
         if not self.last_interaction:
             return True
         
-        expiration_time = datetime.now() - timedelta(minutes=timeout_minutes)
-        return self.last_interaction < expiration_time
+        return self.last_interaction < time.time() - timeout_minutes * 60
     
     def end_session(self):
         """End the current session"""
         self.current_state = 'END'
         self.context = {}
-        self.update_session()
+        self.changes = {'state': 'END', 'reset': True}
+        self.last_interaction = int(time.time())
+        self.mark_dirty()
 
 class SessionManager:
-    def __init__(self):
-        self.active_sessions = {}
+    """Capacity-bounded LRU cache of sessions with idle expiry and write-behind saves"""
+    
+    def __init__(self, db=None, capacity=None, idle_ttl=None, sweep_interval=None,
+                 durability=None, flush_interval=None, flush_batch=None, shared=None):
+        self.db = db or Database()
+        self.capacity = capacity or int(os.getenv('SESSION_CACHE_SIZE', 10000))
+        self.idle_ttl = idle_ttl or float(os.getenv('SESSION_IDLE_TTL', 1800))
+        self.sweep_interval = sweep_interval or float(os.getenv('SESSION_SWEEP_INTERVAL', 60))
+        if shared is None:
+            shared = os.getenv('SESSION_SHARED', 'false').lower() == 'true'
+        # Several worker processes share the database: revalidate cached sessions on
+        # every lookup and, unless told otherwise, make every change visible at once
+        self.shared = shared
+        default_durability = 'immediate' if shared else 'batched'
+        self.durability = (durability or os.getenv('SESSION_DURABILITY', default_durability)).lower()
+        if self.durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown session durability mode: {self.durability}")
+        self.flush_interval = flush_interval or float(os.getenv('SESSION_FLUSH_INTERVAL', 1.0))
+        self.flush_batch = flush_batch or int(os.getenv('SESSION_FLUSH_BATCH', 500))
+        self.active_sessions = OrderedDict()
+        # Sessions removed from the cache but not yet persisted
+        self.evicting = {}
+        # Dirty sessions waiting for the next batched flush
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.wakeup = threading.Event()
+        self.worker = None
+        self.last_sweep = time.monotonic()
+        # Called with the user id of every session that leaves the cache
+        self.eviction_listeners = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.write_errors = 0
+        self.conflicts = 0
+        self.stale_reloads = 0
     
     def get_session(self, user_id):
         """Get or create a session for a user"""
-        if user_id not in self.active_sessions:
-            session = ConversationSession(user_id)
-            session.start_session()
-            self.active_sessions[user_id] = session
+        self._ensure_worker()
+        with self.lock:
+            session = self.active_sessions.get(user_id) or self.evicting.get(user_id)
+            if session is not None:
+                self.hits += 1
+                self.active_sessions[user_id] = session
+                self.active_sessions.move_to_end(user_id)
+            else:
+                self.misses += 1
         
-        session = self.active_sessions[user_id]
+        if session is None:
+            loaded = ConversationSession(user_id, self.db, owner=self)
+            loaded.start_session()
+            with self.lock:
+                session = self.active_sessions.setdefault(user_id, loaded)
+                evicted = self._evict_overflow()
+            self._persist(evicted)
+            self._notify_evicted(evicted)
+        elif self.shared and not session.dirty:
+            # Another worker may have changed this user since we cached it
+            if self.db.get_conversation_version(user_id) != session.version:
+                session.start_session()
+                with self.lock:
+                    self.stale_reloads += 1
+        
+        session.last_access = time.monotonic()
         if session.is_session_expired():
+            # Save unflushed changes before resuming from storage
+            self._write([session])
             session.start_session()
         
         return session
     
     def end_session(self, user_id):
         """End a user's session"""
-        if user_id in self.active_sessions:
-            self.active_sessions[user_id].end_session()
-            del self.active_sessions[user_id]
+        with self.lock:
+            session = self.active_sessions.pop(user_id, None) or self.evicting.pop(user_id, None)
+        if session is not None:
+            session.end_session()
+            self._notify_evicted([session])
+    
+    def add_eviction_listener(self, callback):
+        """Call callback(user_id) whenever a session is evicted, expires or ends"""
+        self.eviction_listeners.append(callback)
+    
+    def _notify_evicted(self, sessions):
+        """Tell listeners which sessions left the cache"""
+        for session in sessions:
+            for callback in self.eviction_listeners:
+                try:
+                    callback(session.user_id)
+                except Exception as e:
+                    logger.error(f"Error in session eviction listener: {str(e)}")
+    
+    def schedule(self, session):
+        """Queue a dirty session for saving according to the durability mode"""
+        if self.durability == 'immediate':
+            self._write([session])
+            return
+        with self.lock:
+            self.pending[session.user_id] = session
+            full = len(self.pending) >= self.flush_batch
+        self._ensure_worker()
+        if full:
+            self.wakeup.set()
+    
+    def flush(self):
+        """Save every pending session in a single transaction"""
+        with self.lock:
+            batch = list(self.pending.values())
+            self.pending.clear()
+        return self._write(batch)
+    
+    def _write(self, sessions):
+        """Save the dirty sessions among those given, returning how many were written"""
+        batch = [session for session in sessions if session.dirty]
+        if not batch:
+            return 0
+        # Clear first so a change made during the write marks the session again
+        for session in batch:
+            session.dirty = False
+        try:
+            results = self.db.save_conversation_states(
+                [(session.user_id, session.version, session.snapshot(), session.merge) for session in batch]
+            )
+        except Exception as e:
+            logger.error(f"Error saving {len(batch)} sessions: {str(e)}")
+            with self.lock:
+                self.write_errors += 1
+                for session in batch:
+                    session.dirty = True
+                    self.pending.setdefault(session.user_id, session)
+            return 0
+        conflicts = 0
+        for session, (state, version, conflicted) in zip(batch, results):
+            session.saved(state, version, conflicted)
+            conflicts += conflicted
+        with self.lock:
+            self.flushes += 1
+            self.flushed += len(batch)
+            self.conflicts += conflicts
+        return len(batch)
+    
+    def _evict_overflow(self):
+        """Remove least recently used sessions beyond capacity; caller holds the lock"""
+        evicted = []
+        while len(self.active_sessions) > self.capacity:
+            user_id, session = self.active_sessions.popitem(last=False)
+            self.evictions += 1
+            if session.dirty:
+                self.evicting[user_id] = session
+            evicted.append(session)
+        return evicted
+    
+    def _persist(self, sessions):
+        """Save the dirty sessions among those that have left the cache"""
+        if not sessions:
+            return
+        try:
+            self._write(sessions)
+        finally:
+            with self.lock:
+                for session in sessions:
+                    if self.evicting.get(session.user_id) is session:
+                        del self.evicting[session.user_id]
+    
+    def sweep(self):
+        """Evict sessions idle for longer than the TTL, persisting dirty ones"""
+        cutoff = time.monotonic() - self.idle_ttl
+        expired = []
+        removed = []
+        with self.lock:
+            self.last_sweep = time.monotonic()
+            while self.active_sessions:
+                user_id, session = next(iter(self.active_sessions.items()))
+                if session.last_access > cutoff:
+                    break
+                del self.active_sessions[user_id]
+                self.expirations += 1
+                removed.append(session)
+                if session.dirty:
+                    self.evicting[user_id] = session
+                    expired.append(session)
+        self._persist(expired)
+        self._notify_evicted(removed)
+        return len(expired)
+    
+    def _ensure_worker(self):
+        """Start the background flusher and sweeper on first use"""
+        if self.worker is not None:
+            return
+        with self.lock:
+            if self.worker is not None:
+                return
+            self.worker = threading.Thread(target=self._run, name='session-worker', daemon=True)
+            self.worker.start()
+        atexit.register(self.close)
+    
+    def _run(self):
+        """Flush pending sessions every interval and drop idle ones periodically"""
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self.last_sweep >= self.sweep_interval:
+                    self.sweep()
+            except Exception as e:
+                logger.error(f"Error in session worker: {str(e)}")
+    
+    def close(self):
+        """Stop the worker and persist every dirty session"""
+        self.stopped.set()
+        self.wakeup.set()
+        if self.worker is not None and self.worker is not threading.current_thread():
+            self.worker.join(timeout=5)
+        self.flush()
+        with self.lock:
+            dirty = [s for s in self.active_sessions.values() if s.dirty]
+        self._write(dirty)
+    
+    def get_stats(self):
+        """Get cache size, hit, miss and eviction counters and write-behind state"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.active_sessions),
+                'capacity': self.capacity,
+                'idle_ttl': self.idle_ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'shared': self.shared,
+                'durability': self.durability,
+                'pending': len(self.pending),
+                'flushes': self.flushes,
+                'flushed': self.flushed,
+                'write_errors': self.write_errors,
+                'conflicts': self.conflicts,
+                'stale_reloads': self.stale_reloads
+            }
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+
+class SingleFlight:
+    """Collapses concurrent coroutine calls with the same key into one in-flight call
+
+    The first caller for a key starts the call; callers arriving before it
+    finishes await the same task and get its result or exception.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.leaders = 0
+        self.collapsed = 0
+
+    async def do(self, key, factory):
+        """Await factory() once per key across concurrent callers"""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            task = self.calls.get(key)
+            # A task only helps callers on its own event loop
+            if task is not None and task.get_loop() is loop:
+                self.collapsed += 1
+            else:
+                task = self.calls[key] = loop.create_task(factory())
+                task.add_done_callback(lambda done: self._forget(key, done))
+                self.leaders += 1
+        # Shielded so one cancelled caller does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        with self.lock:
+            if self.calls.get(key) is task:
+                del self.calls[key]
+        # Mark a failure as retrieved even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self):
+        """Get in-flight and collapsed call counts"""
+        return {
+            'in_flight': len(self.calls),
+            'upstream_calls': self.leaders,
+            'collapsed': self.collapsed
+        }
@@ -0,0 +1,58 @@
+import mmap
+import os
+import pickle
+import struct
+
+MAGIC = b'BOTSNAP1'
+HEADER = struct.Struct('<8sQQ')
+BUFFER_ENTRY = struct.Struct('<QQ')
+ALIGNMENT = 64
+
+def write_snapshot(path, state):
+    """Atomically write state, with large array buffers stored raw for memory mapping"""
+    buffers = []
+    payload = pickle.dumps(state, protocol=5, buffer_callback=buffers.append)
+    raw_buffers = [buffer.raw() for buffer in buffers]
+
+    offset = HEADER.size + BUFFER_ENTRY.size * len(raw_buffers) + len(payload)
+    entries = []
+    for raw in raw_buffers:
+        offset += -offset % ALIGNMENT
+        entries.append((offset, raw.nbytes))
+        offset += raw.nbytes
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(payload), len(raw_buffers)))
+        for entry in entries:
+            f.write(BUFFER_ENTRY.pack(*entry))
+        f.write(payload)
+        for (start, _), raw in zip(entries, raw_buffers):
+            f.write(b'\0' * (start - f.tell()))
+            f.write(raw)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def read_snapshot(path):
+    """Read a snapshot, or None if there is none; array buffers stay memory-mapped"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            return None
+        # The mapping stays alive for as long as arrays loaded from it reference it
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    magic, payload_size, buffer_count = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        return None
+    position = HEADER.size
+    buffers = []
+    for _ in range(buffer_count):
+        start, size = BUFFER_ENTRY.unpack_from(view, position)
+        buffers.append(view[start:start + size])
+        position += BUFFER_ENTRY.size
+    return pickle.loads(view[position:position + payload_size], buffers=buffers)
@@ -3,8 +3,8 @@ from datetime import datetime, timedelta
 from collections import defaultdict
 
 class StatsManager:
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db=None):
+        self.db = db or Database()
     
     def get_active_users(self, hours=24):
         """Get number of active users in last X hours"""
@@ -204,6 +204,3 @@ class StatsManager:
                 }
                 for row in cursor.fetchall()
             ]
-
-# Create global stats manager instance
-stats_manager = StatsManager()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Tests for AIEngine on the shared event loop"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_engine import AIEngine
+from database import Database
+
+class SlowDatabase(Database):
+    """Every custom-response lookup waits as if SQLite were busy"""
+
+    def get_custom_response(self, trigger):
+        time.sleep(0.2)
+        return super().get_custom_response(trigger)
+
+def test_blocking_lookups_do_not_stall_the_loop(db_path):
+    async def backend(**kwargs):
+        return type('Response', (), {'choices': [type('Choice', (), {'message': {'content': 'Hi'}})()]})()
+    engine = AIEngine(db=SlowDatabase(db_path), completion_backend=backend)
+
+    async def scenario():
+        ticks = []
+        async def ticker():
+            for _ in range(10):
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+        await asyncio.gather(engine.generate_response('u1', 'what are your opening hours'), ticker())
+        return max(b - a for a, b in zip(ticks, ticks[1:]))
+    assert asyncio.run(scenario()) < 0.1
+
+def test_saved_responses_become_message_payloads(db):
+    async def backend(**kwargs):
+        raise AssertionError('saved responses must not call the backend')
+    engine = AIEngine(db=db, completion_backend=backend)
+
+    db.save_custom_response('hours', {'type': 'text', 'content': 'Nine to five'})
+    db.save_custom_response('logo', {'type': 'media', 'media_type': 'image', 'media_url': 'https://example.com/logo.png'})
+    # learn_from_feedback stores the JSON of the learned answer
+    db.save_custom_response('where', json.dumps({'text': 'Cairo', 'confidence': 1.0, 'learned': True}), learned=True)
+
+    assert asyncio.run(engine.generate_response('u1', 'Hours?')) == {'text': 'Nine to five'}
+    assert asyncio.run(engine.generate_response('u1', 'logo')) == {
+        'attachment': {'type': 'image', 'payload': {'url': 'https://example.com/logo.png'}}
+    }
+    assert asyncio.run(engine.generate_response('u1', 'where')) == {'text': 'Cairo'}
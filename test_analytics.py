@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Tests for write-behind analytics buffering"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from analytics import Analytics
+
+def count_rows(analytics, table):
+    with analytics.get_connection() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def make_analytics(tmp_path, **kwargs):
+    return Analytics(str(tmp_path / 'analytics.db'), **kwargs)
+
+def test_buffered_writes_flush_in_one_batch(tmp_path):
+    analytics = make_analytics(tmp_path, buffered=True, flush_interval=3600)
+    for i in range(10):
+        analytics.log_interaction(f"user-{i}", 'text_message', 'hello')
+        analytics.update_daily_metric('total_messages')
+
+    assert count_rows(analytics, 'interactions') == 0
+    assert analytics.flush() == 10
+    assert count_rows(analytics, 'interactions') == 10
+
+    report = analytics.generate_daily_report()
+    assert report['metrics']['total_messages'] == 10
+    assert analytics.get_stats()['flushes'] == 1
+    analytics.close()
+
+def test_reports_include_buffered_interactions(tmp_path):
+    analytics = make_analytics(tmp_path, buffered=True, flush_interval=3600)
+    analytics.log_interaction('user', 'postback', 'MAIN_MENU')
+    assert analytics.get_popular_interactions() == [('postback', 1)]
+    analytics.close()
+
+def test_buffer_is_bounded(tmp_path):
+    analytics = make_analytics(tmp_path, buffered=True, batch_size=1000, flush_interval=3600, max_buffer=5)
+    for i in range(8):
+        analytics.log_interaction('user', 'text_message', i)
+    assert analytics.get_stats()['dropped'] == 3
+    analytics.close()
+    assert count_rows(analytics, 'interactions') == 5
+
+def test_unbuffered_mode_writes_immediately(tmp_path):
+    analytics = make_analytics(tmp_path, buffered=False)
+    analytics.log_interaction('user', 'text_message', 'hello')
+    assert count_rows(analytics, 'interactions') == 1
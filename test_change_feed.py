@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Tests for cross-worker learned-response refresh through the change log"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from change_feed import ChangeFeed
+from database import Database
+
+def test_feedback_from_another_worker_is_applied(db, make_learner):
+    first_worker = make_learner()
+    second_worker = make_learner(db=Database(db.db_path))
+
+    db.save_conversation('user', 'Where is my order?', 'On the way', is_bot=True)
+    conversation_id = db.get_last_conversation_id()
+    db.save_feedback(conversation_id, 1)
+    first_worker.learn_from_feedback(conversation_id, 1)
+
+    assert second_worker.get_learned_response('where is my order') is None
+    assert second_worker.change_feed.poll() >= 1
+    assert second_worker.get_learned_response('where is my order')['text'] == 'On the way'
+
+    # The worker that learned it directly does not learn it twice
+    first_worker.change_feed.poll()
+    assert first_worker.response_patterns['where is my order'] == ['On the way']
+
+def test_negative_feedback_is_not_logged(db):
+    db.save_conversation('user', 'hello', 'hi', is_bot=True)
+    db.save_feedback(db.get_last_conversation_id(), -1)
+
+    assert db.get_changes_since(0) == []
+
+def test_subscribers_receive_changed_keys_once(db):
+    feed = ChangeFeed(db, batch_size=2)
+    received = []
+    feed.subscribe('conversation_history', received.extend)
+    feed.last_seq = db.get_last_change_seq()
+
+    row_ids = []
+    for message in ('a', 'b', 'c'):
+        db.save_conversation('user', message, message.upper(), is_bot=True)
+        row_ids.append(str(db.get_last_conversation_id()))
+        db.save_feedback(db.get_last_conversation_id(), 1)
+
+    assert feed.poll() == 3
+    assert received == row_ids
+    assert feed.poll() == 0
+    assert feed.get_stats()['last_seq'] == db.get_last_change_seq()
+
+def test_custom_responses_are_not_logged(db):
+    db.save_custom_response('hours', {'type': 'text', 'content': 'Nine to five'})
+
+    assert db.get_changes_since(0) == []
+
+def test_snapshot_waits_for_index_changes(make_learner):
+    learner = make_learner()
+    with learner.lock:
+        # A pattern learned on another thread waits until the holder is done
+        worker = threading.Thread(target=learner.add_pattern, args=('hello', 'Hi'))
+        worker.start()
+        worker.join(0.1)
+        assert worker.is_alive() and 'hello' not in learner.response_patterns.patterns
+    worker.join()
+    assert learner.response_patterns['hello'] == ['Hi']
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Tests for the AI completion cache"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_engine import AIEngine
+from completion_cache import CompletionCache
+
+def test_key_normalises_message_and_tracks_prompt_version():
+    cache = CompletionCache(enabled=True)
+    key = cache.make_key('What are your hours?', None, 'gpt', 'v1')
+    assert key == cache.make_key('what are your HOURS', None, 'gpt', 'v1')
+    assert key != cache.make_key('what are your hours', None, 'gpt', 'v2')
+    assert key != cache.make_key('what are your hours', {'city': 'Cairo'}, 'gpt', 'v1')
+
+def test_history_dependent_turns_bypass():
+    cache = CompletionCache(enabled=True)
+    assert cache.make_key('yes', None, 'gpt', 'v1') is None
+    assert cache.make_key('how much does that cost', None, 'gpt', 'v1') is None
+    history = [{'message': 'hello', 'response': 'Hi', 'is_bot': True}]
+    assert cache.make_key('what are your hours', None, 'gpt', 'v1', history) is None
+    assert cache.get_stats()['bypasses'] == {'short_message': 1, 'followup': 1, 'history': 1}
+
+def test_lru_and_ttl_eviction():
+    cache = CompletionCache(capacity=2, ttl=60, enabled=True)
+    cache.put('a', 'A')
+    cache.put('b', 'B')
+    cache.get('a')
+    cache.put('c', 'C')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A'
+
+    cache.entries['a'] = ('A', time.time() - 120)
+    assert cache.get('a') is None
+    stats = cache.get_stats()
+    assert stats['evictions'] == 1 and stats['expirations'] == 1
+
+def test_persistent_tier_is_shared(db):
+    CompletionCache(db=db, persistent=True, enabled=True).put('key', 'Cached answer')
+    other = CompletionCache(db=db, persistent=True, enabled=True)
+    assert other.get('key') == 'Cached answer'
+    assert other.get('key') == 'Cached answer'
+    stats = other.get_stats()
+    assert stats['persistent_hits'] == 1 and stats['hits'] == 1 and stats['calls_saved'] == 2
+
+def test_ai_engine_skips_upstream_call_on_hit(db, monkeypatch):
+    import openai
+
+    calls = []
+    async def fake_acreate(**kwargs):
+        calls.append(kwargs)
+        return type('Response', (), {'choices': [type('Choice', (), {'message': {'content': 'Nine to five'}})()]})()
+    monkeypatch.setattr(openai.ChatCompletion, 'acreate', fake_acreate)
+
+    engine = AIEngine(db=db)
+    engine.completion_cache = CompletionCache(enabled=True)
+    assert asyncio.run(engine.generate_response('u1', 'What are your hours?')) == 'Nine to five'
+    assert asyncio.run(engine.generate_response('u2', 'what are your hours')) == 'Nine to five'
+    assert len(calls) == 1
+    assert engine.get_stats()['completion_cache']['calls_saved'] == 1
+
+def test_users_with_history_keep_it_and_skip_the_cache(db):
+    prompts = []
+    async def backend(**kwargs):
+        prompts.append(kwargs['messages'])
+        reply = 'Ahmed, order 123 ships tomorrow' if 'Ahmed' in str(kwargs['messages']) else 'Orders ship within two days'
+        return type('Response', (), {'choices': [type('Choice', (), {'message': {'content': reply}})()]})()
+
+    db.save_conversation('alice', 'my name is Ahmed and my order is 123', 'Thanks Ahmed', is_bot=True)
+    engine = AIEngine(db=db, completion_backend=backend)
+    engine.completion_cache = CompletionCache(enabled=True)
+
+    carol = asyncio.run(engine.generate_response('carol', 'when will my order ship'))
+    alice = asyncio.run(engine.generate_response('alice', 'when will my order ship'))
+    dave = asyncio.run(engine.generate_response('dave', 'when will my order ship'))
+    assert carol == dave == 'Orders ship within two days'
+    assert alice == 'Ahmed, order 123 ships tomorrow'
+    assert len(prompts) == 2
+    assert [message['role'] for message in prompts[0]] == ['system', 'user']
+    assert [message['role'] for message in prompts[1]] == ['system', 'user', 'assistant', 'user']
+
+    # Once carol has talked to the bot her turns carry her history too
+    asyncio.run(engine.generate_response('carol', 'when will my order ship'))
+    assert len(prompts) == 3
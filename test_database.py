@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Tests for database schema migrations and hot-path query plans"""
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import Database, MIGRATIONS
+
+def query_plan(db, sql, params=()):
+    with db.get_connection() as conn:
+        return ' | '.join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+def test_conversation_history_uses_user_index(db):
+    plan = query_plan(db, '''
+        SELECT message, response, is_bot, timestamp
+        FROM conversation_history
+        WHERE user_id = ?
+        ORDER BY timestamp DESC
+        LIMIT ?
+    ''', ('user', 10))
+    assert 'idx_conversation_history_user_ts' in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_successful_responses_use_feedback_index(db):
+    plan = query_plan(db, '''
+        SELECT message, response
+        FROM conversation_history
+        WHERE is_bot = 1 AND feedback >= ?
+    ''', (1,))
+    assert 'idx_conversation_history_feedback' in plan
+
+def test_stats_date_filters_use_expression_indexes(db):
+    today = datetime.now().date().isoformat()
+    plan = query_plan(db, 'SELECT COUNT(*) FROM conversation_history WHERE DATE(timestamp) = ?', (today,))
+    assert 'idx_conversation_history_date' in plan
+
+    plan = query_plan(db, 'SELECT COUNT(DISTINCT user_id) FROM conversation_history WHERE timestamp >= ?', (today,))
+    assert 'idx_conversation_history_ts' in plan
+
+    plan = query_plan(db, '''
+        SELECT COUNT(DISTINCT user_id), COUNT(*)
+        FROM interactions
+        WHERE date(timestamp) = ?
+    ''', (today,))
+    assert 'idx_interactions_date' in plan
+
+def test_user_stats_use_interactions_index(db):
+    plan = query_plan(db, '''
+        SELECT user_id, COUNT(*) as interactions_per_user
+        FROM interactions
+        WHERE timestamp >= ?
+        GROUP BY user_id
+    ''', (datetime.now().isoformat(),))
+    assert 'idx_interactions_ts_user' in plan
+
+def test_existing_database_is_upgraded_in_place(tmp_path):
+    db_path = str(tmp_path / 'legacy.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('''
+            CREATE TABLE conversation_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT,
+                message TEXT,
+                response TEXT,
+                is_bot BOOLEAN,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                feedback INTEGER DEFAULT 0
+            )
+        ''')
+        conn.execute("INSERT INTO conversation_history (user_id, message, response, is_bot) VALUES ('u', 'hi', 'hello', 1)")
+
+    db = Database(db_path)
+
+    with db.get_connection() as conn:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert version == MIGRATIONS[-1][0]
+    assert 'idx_conversation_history_user_ts' in indexes
+    assert 'idx_interactions_ts_user' in indexes
+    assert db.get_conversation_history('u')[0]['message'] == 'hi'
+
+    # Re-opening an up-to-date database is a no-op
+    Database(db_path)
+
+def test_legacy_response_triggers_are_normalized(tmp_path):
+    db_path = str(tmp_path / 'legacy.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('''
+            CREATE TABLE responses (
+                trigger TEXT PRIMARY KEY,
+                response TEXT,
+                confidence REAL,
+                learned BOOLEAN DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        rows = [
+            ('مساعدة', '"legacy"', '2024-01-01'),
+            ('مساعده', '"current"', '2023-01-01'),
+            ('Hours?', '"older"', '2023-01-01'),
+            ('hours!', '"newer"', '2024-01-01'),
+        ]
+        conn.executemany('INSERT INTO responses (trigger, response, created_at) VALUES (?, ?, ?)', rows)
+
+    db = Database(db_path)
+
+    # An already normalized trigger keeps its row; otherwise the newest wins
+    assert db.get_custom_response('مساعده')['text'] == 'current'
+    assert db.get_custom_response('hours')['text'] == 'newer'
+    with db.get_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0] == 2
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Tests for webhook event deduplication"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dedup import EventDeduplicator, event_key
+
+def test_event_keys():
+    message = {'sender': {'id': '1'}, 'message': {'mid': 'm.abc', 'text': 'hi'}}
+    postback = {'sender': {'id': '1'}, 'timestamp': 1700000000, 'postback': {'payload': 'MAIN_MENU'}}
+    read = {'sender': {'id': '1'}, 'read': {'watermark': 1700000001}}
+
+    assert event_key(message) == 'mid:m.abc'
+    assert event_key(postback) == 'postback:1:1700000000:MAIN_MENU'
+    assert event_key(read) == 'read:1:1700000001'
+    assert event_key({'sender': {'id': '1'}}) is None
+
+def test_duplicates_are_suppressed_until_expiry():
+    dedup = EventDeduplicator(ttl=0.2, max_size=100, backend='memory')
+
+    assert not dedup.is_duplicate('mid:1')
+    assert dedup.is_duplicate('mid:1')
+    assert not dedup.is_duplicate(None)
+    time.sleep(0.25)
+    assert not dedup.is_duplicate('mid:1')
+    assert dedup.get_stats()['suppressed'] == 1
+
+def test_cache_is_bounded():
+    dedup = EventDeduplicator(ttl=60, max_size=10, backend='memory')
+    for i in range(50):
+        dedup.is_duplicate(f"mid:{i}")
+    assert dedup.get_stats()['cached_keys'] == 10
+
+def test_sqlite_backend_is_shared_between_workers():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'dedup.db')
+        worker_a = EventDeduplicator(ttl=60, backend='sqlite', db_path=db_path)
+        worker_b = EventDeduplicator(ttl=60, backend='sqlite', db_path=db_path)
+
+        assert not worker_a.is_duplicate('mid:shared')
+        assert worker_b.is_duplicate('mid:shared')
+        assert not worker_b.is_duplicate('mid:other')
+        assert worker_b.get_stats()['suppressed'] == 1
+
+def test_released_keys_can_be_claimed_again():
+    with tempfile.TemporaryDirectory() as tmp:
+        dedup = EventDeduplicator(ttl=60, backend='sqlite', db_path=os.path.join(tmp, 'dedup.db'))
+        assert not dedup.is_duplicate('mid:1')
+        dedup.release('mid:1')
+        assert not dedup.is_duplicate('mid:1')
+        assert dedup.is_duplicate('mid:1')
+        dedup.pool.close_all()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Tests for the per-user conversation history ring buffer"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_engine import AIEngine
+from database import Database
+from history_buffer import HistoryBuffer
+from session_manager import SessionManager
+
+class CountingDatabase(Database):
+    """Counts history queries"""
+
+    history_queries = 0
+
+    def get_conversation_history(self, user_id, limit=10):
+        self.history_queries += 1
+        return super().get_conversation_history(user_id, limit)
+
+@pytest.fixture
+def db(db_path):
+    return CountingDatabase(db_path)
+
+def test_loads_once_then_serves_appended_turns(db):
+    db.save_conversation('u1', 'hello', 'Hi', is_bot=True)
+    history = HistoryBuffer(db, size=3, enabled=True)
+    assert [turn['message'] for turn in history.get('u1')] == ['hello']
+
+    for i in range(4):
+        db.save_conversation('u1', f"question {i}", f"answer {i}", is_bot=True)
+        history.append('u1', f"question {i}", f"answer {i}", is_bot=True)
+    assert [turn['message'] for turn in history.get('u1')] == ['question 1', 'question 2', 'question 3']
+    assert db.history_queries == 1
+
+def test_unloaded_users_are_filled_from_the_database(db):
+    history = HistoryBuffer(db, size=5, enabled=True)
+    db.save_conversation('u1', 'hello', 'Hi', is_bot=True)
+    history.append('u1', 'hello', 'Hi', is_bot=True)
+    assert [turn['response'] for turn in history.get('u1')] == ['Hi']
+    assert history.get_stats()['appends'] == 0
+
+def test_prepare_messages_skips_database_in_steady_state(db):
+    engine = AIEngine(db=db, history=HistoryBuffer(db, size=10, enabled=True))
+    engine.prepare_messages('u1', 'first')
+    engine.save_conversation('u1', 'first', 'Reply')
+    messages = engine.prepare_messages('u1', 'second')
+
+    assert [message['content'] for message in messages[1:]] == ['first', 'Reply', 'second']
+    assert db.history_queries == 1
+
+def test_ring_is_dropped_with_the_session(db):
+    history = HistoryBuffer(db, enabled=True)
+    manager = SessionManager(db=db, capacity=1, durability='immediate')
+    manager.add_eviction_listener(history.discard)
+
+    manager.get_session('u1')
+    history.get('u1')
+    manager.get_session('u2')
+    assert history.get_stats()['users'] == 0
+
+    history.get('u2')
+    manager.end_session('u2')
+    assert history.get_stats()['discards'] == 2
+    manager.close()
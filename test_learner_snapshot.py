@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Tests for the learner snapshot and incremental startup"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from snapshot import read_snapshot, write_snapshot
+
+def add_learned_row(db, message, response):
+    db.save_conversation('user', message, response, is_bot=True)
+    with db.get_connection() as conn:
+        conn.execute('UPDATE conversation_history SET feedback = 1 WHERE id = (SELECT MAX(id) FROM conversation_history)')
+
+def test_snapshot_round_trip_keeps_arrays_mapped(tmp_path):
+    np = pytest.importorskip('numpy')
+    path = str(tmp_path / 'state.snap')
+    write_snapshot(path, {'ids': np.arange(1000), 'name': 'index'})
+
+    state = read_snapshot(path)
+    assert state['name'] == 'index'
+    assert state['ids'].sum() == sum(range(1000))
+    assert not state['ids'].flags.writeable
+    assert read_snapshot(path + '.missing') is None
+
+def test_restart_replays_only_new_rows(db, make_learner):
+    add_learned_row(db, 'Where is my order?', 'On the way')
+    first = make_learner(snapshot=True)
+    assert not first.startup_stats['from_snapshot']
+    assert (first.startup_stats['replayed_rows'], first.startup_stats['replayed_changes']) == (1, 0)
+
+    add_learned_row(db, 'Opening hours', 'Nine to five')
+    second = make_learner(snapshot=True)
+    assert second.startup_stats['from_snapshot']
+    assert second.startup_stats['replayed_rows'] == 1
+    assert second.get_learned_response('where is my order')['text'] == 'On the way'
+    assert second.get_learned_response('opening hours')['text'] == 'Nine to five'
+
+    third = make_learner(snapshot=True)
+    assert third.startup_stats['replayed_rows'] == 0
+    assert len(third.index) == 2
+
+def test_snapshot_for_another_matcher_is_ignored(db, make_learner):
+    add_learned_row(db, 'Where is my order?', 'On the way')
+    make_learner(matcher='exact', snapshot=True)
+
+    learner = make_learner(matcher='minhash', snapshot=True)
+    assert not learner.startup_stats['from_snapshot']
+    assert learner.get_learned_response('where is my order')['text'] == 'On the way'
+
+def test_feedback_on_old_rows_is_replayed_without_the_poller(db, make_learner):
+    db.save_conversation('user', 'Opening hours', 'Nine to five', is_bot=True)
+    old_row = db.get_last_conversation_id()
+    add_learned_row(db, 'Where is my order?', 'On the way')
+    make_learner(snapshot=True).close()
+
+    db.save_feedback(old_row, 1)
+    learner = make_learner(snapshot=True)
+    assert learner.startup_stats['from_snapshot']
+    assert learner.startup_stats['replayed_changes'] == 1
+    assert learner.get_learned_response('opening hours')['confidence'] == 1.0
+
+def test_snapshot_is_ignored_once_its_changes_are_pruned(db, make_learner):
+    add_learned_row(db, 'Where is my order?', 'On the way')
+    make_learner(snapshot=True).close()
+
+    add_learned_row(db, 'Opening hours', 'Nine to five')
+    add_learned_row(db, 'Delivery cost', 'Free')
+    db.prune_changes(db.get_last_change_seq())
+    learner = make_learner(snapshot=True)
+    assert not learner.startup_stats['from_snapshot']
+    assert learner.get_learned_response('opening hours')['text'] == 'Nine to five'
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Tests for the approximate MinHash/LSH matcher"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from minhash_index import MinHashIndex
+from token_index import TokenIndex
+
+def test_signatures_are_stable():
+    tokens = frozenset('where is my order'.split())
+    assert MinHashIndex(num_perm=32, bands=8).signature(tokens) == MinHashIndex(num_perm=32, bands=8).signature(tokens)
+
+def test_bands_must_divide_permutations():
+    with pytest.raises(ValueError):
+        MinHashIndex(num_perm=30, bands=8)
+
+def test_exact_duplicates_are_always_found():
+    index = MinHashIndex(num_perm=32, bands=8)
+    index.add('opening hours today')
+    index.add('delivery price to riyadh')
+
+    assert index.best_match('delivery price to riyadh', 0.8) == ('delivery price to riyadh', 1.0)
+    assert index.best_match('something unrelated', 0.8) == (None, 0)
+
+def test_matches_are_exact_and_recall_is_high():
+    rng = random.Random(3)
+    vocabulary = [f"w{i}" for i in range(500)]
+    messages = list(dict.fromkeys(' '.join(rng.sample(vocabulary, 8)) for _ in range(2000)))
+    approximate = MinHashIndex(num_perm=64, bands=32)
+    exact = TokenIndex()
+    for message in messages:
+        approximate.add(message)
+        exact.add(message)
+
+    found = expected = 0
+    for _ in range(200):
+        # One word swapped out of eight gives Jaccard 7/9
+        words = rng.choice(messages).split()
+        words[rng.randrange(len(words))] = rng.choice(vocabulary)
+        query = ' '.join(words)
+        match, score = approximate.best_match(query, 0.7)
+        expected_match, expected_score = exact.best_match(query, 0.7)
+        if match is not None:
+            # Candidates are verified exactly, so no false positives
+            assert score > 0.7
+            assert score <= expected_score
+        expected += expected_match is not None
+        found += match is not None and score == expected_score
+    assert found / expected > 0.9
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Tests for the outbound dispatcher against a local stub Graph API"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from async_runner import AsyncRunner
+from graph_client import GraphAPIError, GraphClient
+from outbound import OutboundDispatcher, TokenBucket
+
+class StubGraphAPI:
+    """Local Graph API stand-in that injects 429s and latency"""
+
+    def __init__(self, throttle_every=3, latency=0.005, error_status=429, error_code=None):
+        self.throttle_every = throttle_every
+        self.latency = latency
+        self.error_status = error_status
+        self.error_code = error_code
+        self.requests = 0
+        self.delivered = []
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                time.sleep(stub.latency)
+                with stub.lock:
+                    stub.requests += 1
+                    fail = stub.throttle_every and stub.requests % stub.throttle_every == 0
+                    if not fail:
+                        stub.delivered.append((body['recipient']['id'], body['message']['text']))
+                if fail:
+                    error = {'message': 'Calls to this api have exceeded the rate limit.'}
+                    if stub.error_code:
+                        error['code'] = stub.error_code
+                    self._reply(stub.error_status, {'error': error})
+                else:
+                    self._reply(200, {'recipient_id': body['recipient']['id'], 'message_id': 'mid'})
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/v17.0"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def make_dispatcher(stub, **kwargs):
+    client = GraphClient(access_token='test-token', api_url=stub.url)
+    options = dict(num_workers=4, rate=500, burst=50, max_retries=8, base_delay=0.005, max_delay=0.05)
+    options.update(kwargs)
+    return OutboundDispatcher(client.send, **options)
+
+def test_per_recipient_order_survives_throttling():
+    stub = StubGraphAPI(throttle_every=3)
+    dispatcher = make_dispatcher(stub)
+    dispatcher.start()
+    try:
+        expected = {}
+        for i in range(20):
+            for recipient in ('alice', 'bob', 'carol'):
+                dispatcher.enqueue(recipient, {'text': f"{recipient}-{i}"})
+                expected.setdefault(recipient, []).append(f"{recipient}-{i}")
+        assert dispatcher.flush(timeout=30)
+    finally:
+        dispatcher.stop(timeout=5)
+        stub.close()
+
+    for recipient, texts in expected.items():
+        assert [text for rid, text in stub.delivered if rid == recipient] == texts
+
+    stats = dispatcher.get_stats()
+    assert stats['sent'] == 60
+    assert stats['failed'] == 0
+    assert stats['retried'] > 0
+    assert stats['throttled'] == stats['retried']
+    assert stats['send_lag']['count'] == 60
+
+def test_permanent_errors_are_not_retried():
+    stub = StubGraphAPI(throttle_every=1, error_status=400, error_code=100)
+    dispatcher = make_dispatcher(stub)
+    dispatcher.start()
+    try:
+        dispatcher.enqueue('alice', {'text': 'hello'})
+        assert dispatcher.flush(timeout=10)
+    finally:
+        dispatcher.stop(timeout=5)
+        stub.close()
+
+    stats = dispatcher.get_stats()
+    assert stub.requests == 1
+    assert stats['failed'] == 1
+    assert stats['retried'] == 0
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, capacity=1)
+    started = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.monotonic() - started >= 0.09
+
+def test_send_async_delivers_and_reports_errors():
+    stub = StubGraphAPI(throttle_every=2, latency=0)
+    client = GraphClient(access_token='test-token', api_url=stub.url)
+
+    async def send_two():
+        first = await client.send_async('alice', {'text': 'hello'})
+        with pytest.raises(GraphAPIError) as error:
+            await client.send_async('alice', {'text': 'again'})
+        await client.aclose()
+        return first, error.value
+
+    try:
+        result, error = asyncio.run(send_two())
+    finally:
+        stub.close()
+
+    assert result == {'recipient_id': 'alice', 'message_id': 'mid'}
+    assert error.is_throttled and error.is_transient
+    assert stub.delivered == [('alice', 'hello')]
+    stats = client.get_stats()
+    assert stats['sent'] == 1
+    assert stats['errors'] == 1
+    assert stats['async_latency']['count'] == 2
+
+def test_async_session_is_closed_when_the_loop_changes():
+    stub = StubGraphAPI(throttle_every=0, latency=0)
+    client = GraphClient(access_token='test-token', api_url=stub.url)
+    first, second = AsyncRunner('first'), AsyncRunner('second')
+    try:
+        first.run(client.send_async('alice', {'text': 'one'}), timeout=5)
+        old_session = client._async_session
+        second.run(client.send_async('alice', {'text': 'two'}), timeout=5)
+        assert client._async_session is not old_session
+
+        deadline = time.monotonic() + 5
+        while not old_session.closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert old_session.closed
+        second.run(client.aclose(), timeout=5)
+    finally:
+        first.stop()
+        second.stop()
+        stub.close()
+
+    assert [text for _, text in stub.delivered] == ['one', 'two']
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Tests for token-budgeted prompt assembly"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from prompt_builder import PromptBuilder, estimate_tokens, truncate
+
+def turn(message, response):
+    return {'message': message, 'response': response, 'is_bot': True}
+
+def test_estimate_counts_arabic_denser_than_ascii():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('abcdefgh') == 2
+    assert estimate_tokens('مرحبا') == 3
+    assert estimate_tokens(truncate('word ' * 100, 10)) <= 10
+
+def test_short_history_is_kept_whole():
+    builder = PromptBuilder(budget=1000)
+    messages = builder.build('system', [turn('hi', 'Hello'), turn('hours?', 'Nine to five')], 'thanks')
+    assert [m['content'] for m in messages] == ['system', 'hi', 'Hello', 'hours?', 'Nine to five', 'thanks']
+    last = builder.get_stats()['last']
+    assert (last['turns'], last['dropped'], last['truncated']) == (2, 0, 0)
+
+def test_oldest_turns_are_truncated_then_dropped():
+    builder = PromptBuilder(budget=200, min_turn_tokens=16)
+    history = [turn(f"question {i} " + 'x' * 200, f"answer {i} " + 'y' * 200) for i in range(5)]
+    messages = builder.build('system', history, 'latest question')
+
+    contents = [m['content'] for m in messages]
+    assert contents[-1] == 'latest question'
+    assert contents[-3].startswith('question 4') and contents[-2].startswith('answer 4')
+    assert not any(content.startswith('question 0') for content in contents)
+    stats = builder.get_stats()
+    assert stats['max_tokens'] <= 200 and stats['over_budget'] == 0
+    assert stats['turns_dropped'] + stats['last']['turns'] == 5
+
+def test_context_and_current_message_are_capped():
+    builder = PromptBuilder(budget=100, context_budget=20)
+    messages = builder.build('system', [], 'z' * 2000, context={'notes': 'n' * 2000})
+    assert messages[1]['role'] == 'system' and estimate_tokens(messages[1]['content']) <= 20
+    assert messages[-1]['content'].endswith('…')
+    assert builder.get_stats()['max_tokens'] <= 100
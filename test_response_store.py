@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Tests for the bounded learned-response store"""
+import os
+import pickle
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from response_store import ResponseStore
+
+def test_deduplicates_and_caps_alternatives():
+    store = ResponseStore(max_alternatives=2, max_patterns=0)
+    store.add('hello', 'Hi')
+    store.add('hello', 'Hey')
+    store.add('hello', 'Hi')
+    assert store['hello'] == ['Hey', 'Hi']
+    assert store.get_stats()['duplicates'] == 1
+
+    store.add('hello', 'Hello there')
+    assert store['hello'] == ['Hi', 'Hello there']
+    assert store.latest('hello') == 'Hello there'
+
+def test_interns_shared_responses():
+    store = ResponseStore(max_alternatives=3, max_patterns=0)
+    store.add('hello', ''.join(['Wel', 'come']))
+    store.add('hi', ''.join(['Welc', 'ome']))
+    assert store['hello'][0] is store['hi'][0]
+    assert store.get_stats()['memory_bytes'] > 0
+
+def test_evicts_least_matched_patterns():
+    store = ResponseStore(max_alternatives=1, max_patterns=3, eviction='hits')
+    for pattern in ('a', 'b', 'c'):
+        store.add(pattern, pattern.upper())
+    store.latest('a')
+    store.latest('b')
+    assert store.add('d', 'D') == ['c']
+    assert 'c' not in store and len(store) == 3
+
+def test_evicts_least_recently_used_patterns():
+    store = ResponseStore(max_alternatives=1, max_patterns=3, eviction='recency')
+    for pattern in ('a', 'b', 'c'):
+        store.add(pattern, pattern.upper())
+    store.latest('a')
+    assert store.add('d', 'D') == ['b']
+
+def test_pickle_keeps_patterns_and_hits():
+    store = ResponseStore(max_alternatives=2, max_patterns=0)
+    store.add('hello', 'Hi')
+    store.latest('hello')
+    restored = pickle.loads(pickle.dumps(store))
+    assert restored['hello'] == ['Hi']
+    assert restored.hits == {'hello': 1}
+
+def test_learner_stops_matching_evicted_patterns(make_learner):
+    learner = make_learner()
+    learner.response_patterns = ResponseStore(max_alternatives=1, max_patterns=2, eviction='recency')
+    learner.add_pattern('where is my order', 'On the way')
+    learner.add_pattern('opening hours', 'Nine to five')
+    learner.add_pattern('delivery cost', 'Free')
+
+    assert learner.get_learned_response('where is my order') is None
+    assert learner.get_learned_response('delivery cost')['text'] == 'Free'
+    assert learner.get_stats()['responses']['evictions'] == 1
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Tests for the bounded session cache"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import Database
+from session_manager import SessionManager
+
+def make_manager(db, **kwargs):
+    return SessionManager(db=db, sweep_interval=3600, **kwargs)
+
+def test_hits_and_misses_are_counted(db):
+    manager = make_manager(db, capacity=10)
+    first = manager.get_session('a')
+    assert manager.get_session('a') is first
+    manager.get_session('b')
+
+    stats = manager.get_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    assert stats['size'] == 2
+    manager.close()
+
+def test_least_recently_used_session_is_evicted(db):
+    manager = make_manager(db, capacity=2)
+    manager.get_session('a')
+    manager.get_session('b')
+    manager.get_session('a')
+    manager.get_session('c')
+
+    assert list(manager.active_sessions) == ['a', 'c']
+    assert manager.get_stats()['evictions'] == 1
+    manager.close()
+
+def test_evicted_dirty_session_is_persisted(db):
+    manager = make_manager(db, capacity=1)
+    session = manager.get_session('a')
+    session.current_state = 'MENU'
+    session.dirty = True
+    manager.get_session('b')
+
+    assert 'a' not in manager.active_sessions
+    assert not manager.evicting
+    assert db.get_conversation_state('a')['state'] == 'MENU'
+    assert manager.get_session('a').current_state == 'MENU'
+    manager.close()
+
+def test_sweep_drops_idle_sessions(db):
+    manager = make_manager(db, capacity=10, idle_ttl=60)
+    idle = manager.get_session('idle')
+    idle.current_state = 'MENU'
+    idle.dirty = True
+    idle.last_access = time.monotonic() - 120
+    manager.active_sessions.move_to_end('idle', last=False)
+    manager.get_session('active')
+
+    assert manager.sweep() == 1
+    assert list(manager.active_sessions) == ['active']
+    assert manager.get_stats()['expirations'] == 1
+    assert db.get_conversation_state('idle')['state'] == 'MENU'
+    manager.close()
+
+def test_sessions_are_slotted_and_share_storage(db):
+    manager = make_manager(db, capacity=10)
+    first = manager.get_session('a')
+    second = manager.get_session('b')
+
+    assert not hasattr(first, '__dict__')
+    assert first.db is second.db is db
+    assert isinstance(first.last_interaction, int)
+    manager.close()
+
+def test_resumed_session_reads_its_row_once(db):
+    manager = make_manager(db, capacity=10)
+    db.save_conversation_state('a', {
+        'state': 'MENU',
+        'context': {'topic': 'orders'},
+        'last_interaction': datetime.now().isoformat()
+    })
+    reads = []
+    for name in ('get_conversation_record', 'get_conversation_state'):
+        method = getattr(db, name)
+        setattr(db, name, lambda user_id, method=method, name=name: reads.append(name) or method(user_id))
+
+    session = manager.get_session('a')
+    assert session.current_state == 'MENU'
+    assert isinstance(session.last_interaction, int)
+    assert session.context == {'topic': 'orders'}
+    assert reads == ['get_conversation_record']
+
+    session.update_session(step=2)
+    manager.flush()
+    assert db.get_conversation_state('a')['context'] == {'topic': 'orders', 'step': 2}
+    manager.close()
+
+def test_batched_updates_are_coalesced_into_one_write(db):
+    manager = make_manager(db, capacity=10, flush_interval=3600)
+    session = manager.get_session('a')
+    session.update_session(new_state='MENU')
+    session.update_session(new_state='ORDERS', step=1)
+    assert db.get_conversation_state('a') is None
+
+    assert manager.flush() == 1
+    assert db.get_conversation_state('a')['state'] == 'ORDERS'
+    assert manager.get_stats()['flushes'] == 1
+    manager.close()
+
+def test_touch_without_changes_is_not_written(db):
+    manager = make_manager(db, capacity=10, flush_interval=3600)
+    session = manager.get_session('a')
+    session.update_session(new_state='START')
+
+    assert not session.dirty
+    assert manager.get_stats()['pending'] == 0
+    manager.close()
+
+def test_immediate_durability_writes_through(db):
+    manager = make_manager(db, capacity=10, durability='immediate')
+    manager.get_session('a').update_session(new_state='MENU')
+
+    assert db.get_conversation_state('a')['state'] == 'MENU'
+    assert manager.get_stats()['pending'] == 0
+    manager.close()
+
+def test_close_flushes_pending_sessions(db):
+    manager = make_manager(db, capacity=10, flush_interval=3600)
+    manager.get_session('a').update_session(new_state='MENU')
+    manager.close()
+
+    assert db.get_conversation_state('a')['state'] == 'MENU'
+
+def test_shared_workers_see_each_others_changes(db):
+    first_worker = make_manager(db, capacity=10, shared=True)
+    second_worker = SessionManager(db=Database(db.db_path), sweep_interval=3600, shared=True)
+    assert first_worker.get_session('a').current_state == 'START'
+
+    second_worker.get_session('a').update_session(new_state='MENU')
+
+    assert first_worker.get_session('a').current_state == 'MENU'
+    assert first_worker.get_stats()['stale_reloads'] == 1
+    first_worker.close()
+    second_worker.close()
+
+def test_concurrent_updates_are_merged_not_lost(db):
+    first_worker = make_manager(db, capacity=10, shared=True)
+    second_worker = SessionManager(db=Database(db.db_path), sweep_interval=3600, shared=True)
+    first = first_worker.get_session('a')
+    second = second_worker.get_session('a')
+
+    first.update_session(topic='orders')
+    second.update_session(new_state='MENU', step=2)
+
+    state, version = db.get_conversation_record('a')
+    assert state['state'] == 'MENU'
+    assert state['context'] == {'topic': 'orders', 'step': 2}
+    assert version == 2
+    assert second.version == 2
+    assert second.context == {'topic': 'orders', 'step': 2}
+    assert second_worker.get_stats()['conflicts'] == 1
+    first_worker.close()
+    second_worker.close()
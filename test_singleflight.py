@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Tests for coalescing identical in-flight AI calls"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_engine import AIEngine
+from completion_cache import CompletionCache
+from database import Database
+from singleflight import SingleFlight
+
+class FakeBackend:
+    """Stands in for ChatCompletion.acreate, answering after a short delay"""
+
+    def __init__(self, reply='Nine to five', delay=0.05):
+        self.reply = reply
+        self.delay = delay
+        self.calls = 0
+        self.prompts = []
+
+    async def __call__(self, **kwargs):
+        self.calls += 1
+        self.prompts.append(kwargs['messages'])
+        await asyncio.sleep(self.delay)
+        return type('Response', (), {'choices': [type('Choice', (), {'message': {'content': self.reply}})()]})()
+
+def make_engine(db, backend):
+    engine = AIEngine(db=db, completion_backend=backend)
+    engine.completion_cache = CompletionCache(enabled=True)
+    return engine
+
+def test_concurrent_identical_questions_share_one_call(db):
+    backend = FakeBackend()
+    engine = make_engine(db, backend)
+
+    async def burst():
+        return await asyncio.gather(*[
+            engine.generate_response(f"user-{i}", 'What are your opening hours?') for i in range(50)
+        ])
+    replies = asyncio.run(burst())
+
+    assert replies == ['Nine to five'] * 50
+    assert backend.calls == 1
+    assert engine.get_stats()['coalescing'] == {'in_flight': 0, 'upstream_calls': 1, 'collapsed': 49}
+
+def test_different_questions_are_not_collapsed(db):
+    backend = FakeBackend()
+    engine = make_engine(db, backend)
+
+    async def burst():
+        return await asyncio.gather(
+            engine.generate_response('user-1', 'What are your opening hours?'),
+            engine.generate_response('user-2', 'Where is your nearest store?')
+        )
+    asyncio.run(burst())
+    assert backend.calls == 2
+
+def test_failure_reaches_every_waiter():
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('upstream down')
+
+    async def burst():
+        return await asyncio.gather(*[flight.do('key', failing) for _ in range(3)], return_exceptions=True)
+    results = asyncio.run(burst())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.get_stats()['collapsed'] == 2
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return 'done'
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.do('key', slow))
+        second = asyncio.ensure_future(flight.do('key', slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+    assert asyncio.run(scenario()) == 'done'
+
+def test_shared_prompt_does_not_depend_on_the_leader(tmp_path):
+    prompts = []
+    for leader, follower in (('carol', 'dave'), ('dave', 'carol')):
+        backend = FakeBackend()
+        engine = make_engine(Database(str(tmp_path / f"{leader}.db")), backend)
+        engine.save_conversation('alice', 'my name is Ahmed and my order is 123', 'Thanks Ahmed')
+
+        async def burst():
+            return await asyncio.gather(
+                engine.generate_response(leader, 'when will my order ship'),
+                engine.generate_response('alice', 'when will my order ship'),
+                engine.generate_response(follower, 'when will my order ship')
+            )
+        asyncio.run(burst())
+        # alice's history keeps her turn out of the shared call
+        assert backend.calls == 2
+        shared = [prompt for prompt in backend.prompts if 'Ahmed' not in str(prompt)]
+        assert len(shared) == 1
+        prompts.append(shared[0])
+
+    assert prompts[0] == prompts[1]
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Tests for the shared message normaliser"""
+import os
+import random
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from text_normalizer import normalize, normalize_arabic
+
+def legacy_clean_message(message):
+    """ConversationLearner.clean_message before the shared normaliser"""
+    message = message.lower().strip()
+    message = re.sub(r'[^\w\s]', '', message)
+    message = re.sub(r'[\u064B-\u065F]', '', message)
+    for old, new in {'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ة': 'ه', 'ى': 'ي'}.items():
+        message = message.replace(old, new)
+    return message
+
+def test_matches_legacy_pipeline():
+    rng = random.Random(11)
+    alphabet = list('abcXYZ019 _!?.,؟،') + [chr(c) for c in range(0x0621, 0x0670)]
+    for _ in range(2000):
+        text = ''.join(rng.choices(alphabet, k=rng.randint(0, 20)))
+        assert normalize(text) == legacy_clean_message(text)
+
+def test_folds_arabic_variants():
+    assert normalize_arabic('إِلَى مَدْرَسَة') == 'الي مدرسه'
+    assert normalize('  أهلاً وسهلاً!  ') == 'اهلا وسهلا'
+
+def test_repeated_inputs_are_memoised():
+    before = normalize.cache_info().hits
+    normalize('Where is my ORDER?')
+    normalize('Where is my ORDER?')
+    assert normalize.cache_info().hits >= before + 1
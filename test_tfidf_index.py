@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Tests for the TF-IDF learned-message matcher"""
+import os
+import random
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+np = pytest.importorskip('numpy')
+
+from tfidf_index import TfidfIndex
+
+def cosine(index, query, learned):
+    """Brute-force TF-IDF cosine with the index's smoothed IDF"""
+    documents = [message.split() for message in index.messages]
+    def vector(words):
+        result = {}
+        for word in set(words):
+            frequency = sum(word in document for document in documents)
+            result[word] = words.count(word) * (np.log((1 + len(documents)) / (1 + frequency)) + 1)
+        return result
+    left, right = vector(query.split()), vector(learned.split())
+    dot = sum(weight * right.get(word, 0) for word, weight in left.items())
+    return dot / (np.linalg.norm(list(left.values())) * np.linalg.norm(list(right.values())))
+
+def test_scores_match_brute_force_cosine():
+    rng = random.Random(5)
+    vocabulary = [f"w{i}" for i in range(40)]
+    index = TfidfIndex()
+    for _ in range(300):
+        index.add(' '.join(rng.choices(vocabulary, k=rng.randint(1, 6))))
+
+    for _ in range(20):
+        query = ' '.join(rng.choices(vocabulary, k=rng.randint(1, 6)))
+        match, score = index.best_match(query, 0.0)
+        expected = [cosine(index, query, learned) for learned in index.messages]
+        assert score == pytest.approx(max(expected))
+        assert index.messages.index(match) == int(np.argmax(np.round(expected, 9)))
+
+def test_batch_matches_single_lookups():
+    index = TfidfIndex(max_batch_cells=4)
+    for message in ('where is my order', 'opening hours today', 'order status please', 'hello'):
+        index.add(message)
+    queries = ['my order where', 'hello', 'unknown words', 'opening hours']
+
+    assert index.best_matches(queries, 0.5) == [index.best_match(query, 0.5) for query in queries]
+    assert index.best_match('unknown words', 0.5) == (None, 0)
+
+def test_index_updates_incrementally():
+    index = TfidfIndex()
+    index.add('where is my order')
+    assert index.best_match('delivery price', 0.5) == (None, 0)
+
+    index.add('delivery price')
+    index.refresh()
+    match, score = index.best_match('delivery price', 0.5)
+    assert match == 'delivery price'
+    assert score == pytest.approx(1.0)
+    assert index.get_stats()['messages'] == 2
+
+def test_lookups_use_the_previous_build_while_rebuilding():
+    index = TfidfIndex(rebuild_delay=0)
+    index.add('where is my order')
+    assert index.best_match('where is my order', 0.5)[0] == 'where is my order'
+
+    with index.build_lock:
+        # A rebuild is pending, but the lookup answers from the last build without waiting
+        index.add('delivery price')
+        assert index.best_match('delivery price', 0.5) == (None, 0)
+        assert index.get_stats()['built_messages'] == 1
+
+    deadline = time.time() + 5
+    while index.get_stats()['built_messages'] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert index.best_match('delivery price', 0.5)[0] == 'delivery price'
+
+def test_learner_uses_selected_matcher(make_learner):
+    learner = make_learner(matcher='tfidf')
+    learner.add_pattern('where is my order', 'It is on the way')
+
+    assert isinstance(learner.index, TfidfIndex)
+    assert learner.get_learned_response('Where is my order?')['text'] == 'It is on the way'
+    assert learner.find_similar_messages(['where is my order', 'hi'])[1] == (None, 0)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Tests for the learned-message token index"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from token_index import TokenIndex
+
+def linear_best_match(messages, query, threshold):
+    """The original ConversationLearner scan"""
+    best_match = None
+    best_score = 0
+    for learned in messages:
+        words1, words2 = set(query.split()), set(learned.split())
+        score = len(words1 & words2) / len(words1 | words2) if words1 and words2 else 0
+        if score > threshold and score > best_score:
+            best_match = learned
+            best_score = score
+    return best_match, best_score
+
+def test_matches_linear_scan():
+    rng = random.Random(7)
+    vocabulary = [f"w{i}" for i in range(60)]
+    messages = list(dict.fromkeys(
+        ' '.join(rng.choices(vocabulary, k=rng.randint(1, 8))) for _ in range(1000)
+    ))
+    index = TokenIndex()
+    for message in messages:
+        index.add(message)
+
+    for _ in range(150):
+        query = ' '.join(rng.choices(vocabulary, k=rng.randint(0, 8)))
+        for threshold in (0.0, 0.3, 0.5, 0.8, 0.99):
+            assert index.best_match(query, threshold) == linear_best_match(messages, query, threshold)
+
+def test_ties_go_to_earliest_message():
+    index = TokenIndex()
+    index.add('hello there friend')
+    index.add('hello there world')
+    index.add('hello there friend')
+
+    assert index.best_match('hello there', 0.5) == ('hello there friend', 2 / 3)
+    assert len(index) == 2
+
+def test_below_threshold_is_not_matched():
+    index = TokenIndex()
+    index.add('opening hours')
+
+    assert index.best_match('delivery price', 0.8) == (None, 0)
+    assert index.best_match('', 0.8) == (None, 0)
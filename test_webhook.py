@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""Tests for webhook admission when the event lanes are full"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as app_module
+
+def test_full_lane_sheds_event_for_redelivery(monkeypatch):
+    handled = []
+    monkeypatch.setattr(app_module.webhook_queue, 'submit', lambda *args, **kwargs: None)
+    monkeypatch.setattr(app_module, 'handle_messaging_event', handled.append)
+    payload = {'object': 'page', 'entry': [{'messaging': [
+        {'sender': {'id': 'shed-user'}, 'message': {'mid': 'm.shed-test', 'text': 'hi'}}
+    ]}]}
+
+    with app_module.app.test_client() as client:
+        assert client.post('/webhook', json=payload).status_code == 503
+        # The claim was released, so Facebook's redelivery is not dropped as a duplicate
+        assert client.post('/webhook', json=payload).status_code == 503
+    assert handled == []
+    assert not app_module.event_deduplicator.is_duplicate('mid:m.shed-test')
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Tests for the in-process webhook work queue"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from work_queue import WorkQueue
+
+def test_items_are_processed_by_workers():
+    processed = []
+    lock = threading.Lock()
+
+    def handler(item):
+        with lock:
+            processed.append(item)
+        return item * 2
+
+    work_queue = WorkQueue(handler, num_lanes=4, lane_backlog=100)
+    work_queue.start()
+    futures = [work_queue.submit(i) for i in range(50)]
+    results = [future.result(timeout=5) for future in futures]
+    work_queue.stop(timeout=5)
+
+    assert sorted(processed) == list(range(50))
+    assert results == [i * 2 for i in range(50)]
+    stats = work_queue.get_stats()
+    assert stats['processed'] == 50
+    assert stats['queue_depth'] == 0
+    assert stats['busy_lanes'] == 0
+    assert sum(lane['processed'] for lane in stats['lanes']) == 50
+
+def test_submit_rejects_when_full():
+    release = threading.Event()
+    work_queue = WorkQueue(lambda item: release.wait(5), num_lanes=1, lane_backlog=2)
+    work_queue.start()
+    futures = [work_queue.submit(i) for i in range(4)]
+    release.set()
+    work_queue.stop(timeout=5)
+
+    # One item is held by the worker, two fit in the lane, the rest are rejected
+    assert None in futures
+    assert work_queue.get_stats()['rejected'] >= 1
+
+def test_handler_errors_are_reported():
+    def handler(item):
+        raise ValueError("boom")
+
+    work_queue = WorkQueue(handler, num_lanes=1, lane_backlog=10)
+    work_queue.start()
+    future = work_queue.submit('event')
+    assert isinstance(future.exception(timeout=5), ValueError)
+    work_queue.stop(timeout=5)
+    assert work_queue.get_stats()['failed'] == 1
+
+def test_same_key_is_processed_in_order():
+    seen = {}
+    lock = threading.Lock()
+
+    def handler(item):
+        sender, sequence = item
+        with lock:
+            seen.setdefault(sender, []).append(sequence)
+
+    work_queue = WorkQueue(handler, num_lanes=4, lane_backlog=1000)
+    work_queue.start()
+    futures = []
+    for sequence in range(100):
+        for sender in ('a', 'b', 'c', 'd', 'e'):
+            futures.append(work_queue.submit((sender, sequence), key=sender))
+    for future in futures:
+        future.result(timeout=5)
+    work_queue.stop(timeout=5)
+
+    for sender, sequences in seen.items():
+        assert sequences == list(range(100))
+    assert work_queue.lane_for('a') == work_queue.lane_for('a')
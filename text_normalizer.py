@@ -0,0 +1,38 @@
+import os
+import re
+from functools import lru_cache
+
+# Anything that is not a word character or whitespace
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+
+# Arabic diacritics (tashkeel) are dropped and letter variants folded in one pass
+ARABIC_TRANSLATION = {codepoint: None for codepoint in range(0x064B, 0x0660)}
+ARABIC_TRANSLATION.update(str.maketrans({
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+}))
+
+CACHE_SIZE = int(os.getenv('NORMALIZER_CACHE_SIZE', 10000))
+
+def normalize_arabic(text):
+    """Remove Arabic diacritics and fold alef, taa marbuta and alef maqsura variants"""
+    return text.translate(ARABIC_TRANSLATION)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize(text):
+    """Normalise a message for matching and as a custom-response key"""
+    text = PUNCTUATION_PATTERN.sub('', text.lower().strip())
+    return text.translate(ARABIC_TRANSLATION)
+
+def get_stats():
+    """Get memo hit and miss counters"""
+    info = normalize.cache_info()
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'capacity': info.maxsize
+    }
@@ -0,0 +1,241 @@
+import math
+import os
+import threading
+import time
+import numpy as np
+from logger import logger
+
+class TfidfIndex:
+    """Cosine similarity over a sparse TF-IDF matrix of learned messages
+
+    Term counts are appended row by row as messages are learned. The column-major
+    arrays, IDF weights and row norms are rebuilt in a background thread and
+    swapped in whole, so lookups keep using the previous build meanwhile. Every
+    lookup is a single sparse matrix-vector (or matrix-matrix) product.
+    """
+
+    def __init__(self, max_batch_cells=None, rebuild_delay=None):
+        self.messages = []
+        self.ids = {}
+        self.vocabulary = {}
+        # Rows appended since the last refresh, in coordinate form
+        self.pending_rows = []
+        self.pending_cols = []
+        self.pending_counts = []
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.cols = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.float64)
+        # (idf, indptr, rows, weights, row count) swapped in whole so lookups see one build
+        self.matrix = None
+        # Rows of discarded messages; they stay in the matrix but never match
+        self.removed = set()
+        self.lock = threading.Lock()
+        # Held by whichever thread is building, so builds never overlap
+        self.build_lock = threading.Lock()
+        self.rebuilding = False
+        self.builds = 0
+        # Caps the dense score block of a batch at 8 MB of float64 so it stays cache friendly
+        self.max_batch_cells = max_batch_cells or 1_000_000
+        # Messages learned within this many seconds of each other share one rebuild
+        self.rebuild_delay = rebuild_delay if rebuild_delay is not None else float(os.getenv('TFIDF_REBUILD_DELAY', 0.1))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        del state['build_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.rebuilding = False
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __contains__(self, message):
+        return message in self.ids
+
+    def add(self, message):
+        """Append a message's term counts once; repeated adds keep the original position"""
+        with self.lock:
+            if message in self.ids:
+                message_id = self.ids[message]
+                self.removed.discard(message_id)
+                return message_id
+            message_id = len(self.messages)
+            for token, count in self._term_counts(message).items():
+                col = self.vocabulary.setdefault(token, len(self.vocabulary))
+                self.pending_rows.append(message_id)
+                self.pending_cols.append(col)
+                self.pending_counts.append(count)
+            self.ids[message] = message_id
+            self.messages.append(message)
+        self._schedule()
+        return message_id
+
+    def discard(self, message):
+        """Stop matching a message; adding it again restores it"""
+        with self.lock:
+            message_id = self.ids.get(message)
+            if message_id is not None:
+                self.removed.add(message_id)
+
+    def _term_counts(self, message):
+        counts = {}
+        for token in message.split():
+            counts[token] = counts.get(token, 0) + 1
+        return counts
+
+    def _stale(self):
+        return self.matrix is None or self.matrix[4] != len(self.messages)
+
+    def _schedule(self):
+        """Start a background rebuild unless one is already pending"""
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self._rebuild_loop, daemon=True).start()
+
+    def _rebuild_loop(self):
+        """Rebuild until the swapped-in matrix covers every learned message"""
+        while True:
+            time.sleep(self.rebuild_delay)
+            with self.lock:
+                if not self._stale():
+                    self.rebuilding = False
+                    return
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error rebuilding TF-IDF matrix: {str(e)}")
+                with self.lock:
+                    self.rebuilding = False
+                return
+
+    def _refresh(self):
+        """Get the current build; only the very first lookup waits for one"""
+        matrix = self.matrix
+        if matrix is None:
+            return self.refresh()
+        if matrix[4] != len(self.messages):
+            # e.g. restored from a snapshot with rows still pending
+            self._schedule()
+        return matrix
+
+    def refresh(self):
+        """Fold pending rows in, recompute IDF weights, norms and column order, and swap the build in"""
+        with self.build_lock:
+            with self.lock:
+                if not self._stale():
+                    return self.matrix
+                pending = (self.pending_rows, self.pending_cols, self.pending_counts)
+                self.pending_rows, self.pending_cols, self.pending_counts = [], [], []
+                num_rows = len(self.messages)
+                num_cols = len(self.vocabulary)
+            matrix = self._build(pending, num_rows, num_cols)
+            with self.lock:
+                self.matrix = matrix
+                self.builds += 1
+            return matrix
+
+    def _build(self, pending, num_rows, num_cols):
+        """Build the matrix from every row; caller holds the build lock"""
+        pending_rows, pending_cols, pending_counts = pending
+        if pending_rows:
+            self.rows = np.concatenate([self.rows, np.array(pending_rows, dtype=np.int64)])
+            self.cols = np.concatenate([self.cols, np.array(pending_cols, dtype=np.int64)])
+            self.counts = np.concatenate([self.counts, np.array(pending_counts, dtype=np.float64)])
+
+        document_frequency = np.bincount(self.cols, minlength=num_cols)
+        # Smoothed IDF, as if one extra document contained every term
+        idf = np.log((1 + num_rows) / (1 + document_frequency)) + 1
+        weights = self.counts * idf[self.cols]
+        norms = np.sqrt(np.bincount(self.rows, weights=weights * weights, minlength=num_rows))
+        norms[norms == 0] = 1
+
+        # Column-major layout so a product only touches the query's terms
+        order = np.argsort(self.cols, kind='stable')
+        csc_rows = self.rows[order]
+        csc_weights = weights[order] / norms[csc_rows]
+        indptr = np.searchsorted(self.cols[order], np.arange(num_cols + 1))
+        return idf, indptr, csc_rows, csc_weights, num_rows
+
+    def _query_terms(self, message, idf, num_rows):
+        """Get the query's known columns and their weights, normalised over all its terms"""
+        counts = self._term_counts(message)
+        unseen_idf = math.log(1 + num_rows) + 1
+        columns = []
+        weights = []
+        norm = 0.0
+        for token, count in counts.items():
+            col = self.vocabulary.get(token)
+            if col is not None and col >= len(idf):
+                # Learned after this build
+                col = None
+            weight = count * (idf[col] if col is not None else unseen_idf)
+            norm += weight * weight
+            if col is not None:
+                columns.append(col)
+                weights.append(weight)
+        norm = math.sqrt(norm) or 1.0
+        return columns, [weight / norm for weight in weights]
+
+    def scores(self, messages):
+        """Score every learned message against each query, one row per query"""
+        idf, indptr, csc_rows, csc_weights, num_rows = self._refresh()
+        positions = []
+        values = []
+        for query_number, message in enumerate(messages):
+            columns, weights = self._query_terms(message, idf, num_rows)
+            for col, weight in zip(columns, weights):
+                start, end = indptr[col], indptr[col + 1]
+                positions.append(csc_rows[start:end] + query_number * num_rows)
+                values.append(csc_weights[start:end] * weight)
+        if not positions:
+            return np.zeros((len(messages), num_rows))
+        flat = np.bincount(
+            np.concatenate(positions), weights=np.concatenate(values), minlength=num_rows * len(messages)
+        )
+        return flat.reshape(len(messages), num_rows)
+
+    def best_matches(self, messages, threshold):
+        """Get (message, score) of the best match above the threshold for each query"""
+        num_rows = len(self.messages)
+        if not num_rows:
+            return [(None, 0) for _ in messages]
+        batch_size = max(1, self.max_batch_cells // num_rows)
+        removed = np.array(list(self.removed), dtype=np.int64)
+        results = []
+        for start in range(0, len(messages), batch_size):
+            batch = messages[start:start + batch_size]
+            scores = self.scores(batch)
+            # Rows learned after the removed set was read are not in scores yet
+            scores[:, removed[removed < scores.shape[1]]] = -np.inf
+            # argmax picks the earliest learned message on ties
+            best_rows = scores.argmax(axis=1)
+            for query_number, row in enumerate(best_rows):
+                score = float(scores[query_number, row])
+                if score > threshold:
+                    results.append((self.messages[row], score))
+                else:
+                    results.append((None, 0))
+        return results
+
+    def best_match(self, message, threshold):
+        """Get the learned message most similar to message above the threshold, and its score"""
+        return self.best_matches([message], threshold)[0]
+
+    def get_stats(self):
+        """Get matrix dimensions and rebuild counters"""
+        matrix = self.matrix
+        return {
+            'messages': len(self.messages),
+            'removed': len(self.removed),
+            'terms': len(self.vocabulary),
+            'nonzeros': len(self.rows) + len(self.pending_rows),
+            'built_messages': matrix[4] if matrix is not None else 0,
+            'builds': self.builds
+        }
@@ -0,0 +1,96 @@
+import math
+from array import array
+
+class TokenIndex:
+    """Inverted token index giving exact Jaccard best matches over learned messages"""
+
+    def __init__(self):
+        # Messages in insertion order; ties go to the earliest one, as in a linear scan
+        self.messages = []
+        # Distinct token count per message; token sets are rebuilt only for candidates
+        self.sizes = array('I')
+        self.ids = {}
+        self.postings = {}
+        # Ids of discarded messages; they keep their postings but never match
+        self.removed = set()
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __contains__(self, message):
+        return message in self.ids
+
+    def add(self, message):
+        """Index a message once; repeated adds keep the original position"""
+        if message in self.ids:
+            message_id = self.ids[message]
+            self.removed.discard(message_id)
+            return message_id
+        message_id = len(self.messages)
+        tokens = set(message.split())
+        self.ids[message] = message_id
+        self.messages.append(message)
+        self.sizes.append(len(tokens))
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = array('I')
+            postings.append(message_id)
+        return message_id
+
+    def candidates(self, tokens, threshold):
+        """Get ids of messages that can beat the threshold, in insertion order"""
+        size = len(tokens)
+        # Jaccard > t needs an overlap above t * |q|, so a match must contain at least one
+        # of the query's rarest |q| - floor(t * |q|) tokens (one spare for float rounding)
+        prefix_length = size - max(1, int(threshold * size)) + 1
+        prefix = sorted(tokens, key=lambda token: len(self.postings.get(token, ())))[:prefix_length]
+        # Jaccard is at most min(|q|, |x|) / max(|q|, |x|)
+        min_size = threshold * size
+        max_size = size / threshold if threshold > 0 else math.inf
+
+        sizes = self.sizes
+        found = set()
+        for token in prefix:
+            for message_id in self.postings.get(token, ()):
+                if min_size <= sizes[message_id] <= max_size:
+                    found.add(message_id)
+        return sorted(found - self.removed) if self.removed else sorted(found)
+
+    def discard(self, message):
+        """Stop matching a message; adding it again restores it"""
+        message_id = self.ids.get(message)
+        if message_id is not None:
+            self.removed.add(message_id)
+
+    def best_match(self, message, threshold):
+        """Get the indexed message most similar to message above the threshold, and its score"""
+        tokens = frozenset(message.split())
+        if threshold < 0:
+            # Even disjoint messages qualify, so every message is a candidate
+            message_ids = [i for i in range(len(self.messages)) if i not in self.removed]
+        elif not tokens:
+            return None, 0
+        else:
+            message_ids = self.candidates(tokens, threshold)
+
+        best_match = None
+        best_score = 0
+        for message_id in message_ids:
+            learned = frozenset(self.messages[message_id].split())
+            if not tokens or not learned:
+                score = 0
+            else:
+                score = len(tokens & learned) / len(tokens | learned)
+            if score > threshold and score > best_score:
+                best_match = self.messages[message_id]
+                best_score = score
+        return best_match, best_score
+
+    def get_stats(self):
+        """Get index size"""
+        return {
+            'messages': len(self.messages),
+            'removed': len(self.removed),
+            'tokens': len(self.postings)
+        }
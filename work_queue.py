@@ -0,0 +1,141 @@
+import os
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from logger import logger
+
+_STOP = object()
+
+class WorkQueue:
+    """Bounded in-process work lanes, each drained by its own worker thread
+
+    Items submitted with the same key always land in the same lane and are
+    processed strictly in order; different lanes run in parallel.
+    """
+
+    def __init__(self, handler, num_lanes=None, lane_backlog=None, name='webhook'):
+        self.handler = handler
+        self.name = name
+        self.num_lanes = num_lanes or int(os.getenv('WEBHOOK_LANES', 8))
+        self.lane_backlog = lane_backlog or int(os.getenv('WEBHOOK_LANE_BACKLOG', 100))
+        self.lanes = [queue.Queue(maxsize=self.lane_backlog) for _ in range(self.num_lanes)]
+        self.lane_busy = [False] * self.num_lanes
+        self.lane_processed = [0] * self.num_lanes
+        self.workers = []
+        self.lock = threading.Lock()
+        self.running = False
+        self.started_at = None
+        self.next_lane = 0
+        self.busy_time = 0.0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        """Start one worker thread per lane"""
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+            self.started_at = time.monotonic()
+            for lane in range(self.num_lanes):
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    args=(lane,),
+                    name=f"{self.name}-lane-{lane}",
+                    daemon=True
+                )
+                worker.start()
+                self.workers.append(worker)
+        logger.info(f"Started {self.num_lanes} {self.name} lanes (backlog {self.lane_backlog} each)")
+
+    def lane_for(self, key):
+        """Pick the lane for a key; unkeyed items are spread round-robin"""
+        if key is None:
+            with self.lock:
+                lane = self.next_lane
+                self.next_lane = (lane + 1) % self.num_lanes
+            return lane
+        return zlib.crc32(str(key).encode('utf-8')) % self.num_lanes
+
+    def submit(self, item, key=None, block=False, timeout=None):
+        """Enqueue an item, returning a Future or None if its lane is full"""
+        future = Future()
+        try:
+            self.lanes[self.lane_for(key)].put((item, future), block=block, timeout=timeout)
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            return None
+        return future
+
+    def _worker_loop(self, lane):
+        """Process a lane's items in order until a stop marker is received"""
+        lane_queue = self.lanes[lane]
+        while True:
+            entry = lane_queue.get()
+            if entry is _STOP:
+                lane_queue.task_done()
+                return
+
+            item, future = entry
+            with self.lock:
+                self.lane_busy[lane] = True
+            started = time.monotonic()
+            try:
+                result = self.handler(item)
+                future.set_result(result)
+                with self.lock:
+                    self.processed += 1
+            except Exception as e:
+                logger.error(f"Error processing {self.name} item: {str(e)}")
+                future.set_exception(e)
+                with self.lock:
+                    self.failed += 1
+            finally:
+                with self.lock:
+                    self.lane_busy[lane] = False
+                    self.lane_processed[lane] += 1
+                    self.busy_time += time.monotonic() - started
+                lane_queue.task_done()
+
+    def stop(self, timeout=None):
+        """Drain every lane and stop the worker threads"""
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+            workers = list(self.workers)
+            self.workers = []
+        for lane_queue in self.lanes:
+            lane_queue.put(_STOP)
+        for worker in workers:
+            worker.join(timeout)
+
+    def get_stats(self):
+        """Get lane backlogs and worker utilisation"""
+        with self.lock:
+            elapsed = time.monotonic() - self.started_at if self.started_at else 0
+            capacity = elapsed * self.num_lanes
+            lanes = [
+                {
+                    'backlog': lane_queue.qsize(),
+                    'busy': self.lane_busy[lane],
+                    'processed': self.lane_processed[lane]
+                }
+                for lane, lane_queue in enumerate(self.lanes)
+            ]
+            return {
+                'running': self.running,
+                'queue_depth': sum(lane['backlog'] for lane in lanes),
+                'lane_count': self.num_lanes,
+                'lane_backlog': self.lane_backlog,
+                'busy_lanes': sum(1 for lane in lanes if lane['busy']),
+                'utilisation': round(self.busy_time / capacity, 4) if capacity else 0.0,
+                'processed': self.processed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'lanes': lanes
+            }